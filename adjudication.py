@@ -0,0 +1,179 @@
+import numpy as np
+import chess
+
+# Kết thúc sớm ván self-play / đánh giá đã rõ kết quả để đỡ tốn search:
+#   - resign: value của bên tới lượt <= resign_threshold trong resign_moves lần đánh giá liên tiếp
+#   - hòa: |value| <= draw_threshold trong draw_moves nước liên tiếp (sau min_draw_ply)
+#   - quá max_plies nước: xử hòa
+#   - tablebase (nếu có): kết quả chính xác khi ít quân
+# Một phần playthrough_fraction số ván vẫn đánh tiếp để đo tỉ lệ resign sai và số nước tiết kiệm được;
+# resign_threshold được hiệu chỉnh theo dữ liệu đó để tỉ lệ resign sai <= target_false_resign.
+RESIGN = "resign"
+DRAW = "draw"
+MAX_PLIES = "max_plies"
+TABLEBASE = "tablebase"
+REASONS = (RESIGN, DRAW, MAX_PLIES, TABLEBASE)
+
+
+def result_for(winner):
+    if winner is None:
+        return "1/2-1/2"
+    return "1-0" if winner == chess.WHITE else "0-1"
+
+
+class Adjudicator:
+    def __init__(self, resign_threshold=-0.9, resign_moves=3, min_resign_ply=20, draw_threshold=0.05, draw_moves=20,
+                 min_draw_ply=80, max_plies=400, tablebase=None, playthrough_fraction=0.1,
+                 target_false_resign=0.05, min_calibration_samples=20, max_resign_threshold=-0.5, seed=None):
+        self.resign_threshold = resign_threshold  # None = không resign
+        self.resign_moves = resign_moves
+        self.min_resign_ply = min_resign_ply
+        self.draw_threshold = draw_threshold  # None = không xử hòa theo value
+        self.draw_moves = draw_moves
+        self.min_draw_ply = min_draw_ply
+        self.max_plies = max_plies  # None = không giới hạn
+        self.tablebase = tablebase
+        self.playthrough_fraction = playthrough_fraction
+        self.target_false_resign = target_false_resign
+        self.min_calibration_samples = min_calibration_samples
+        self.max_resign_threshold = max_resign_threshold  # hiệu chỉnh không nới ngưỡng quá mức này
+        self.rng = np.random.default_rng(seed)
+
+        # (value tệ nhất mà một bên giữ liên tục resign_moves lần, bên đó không thua?) từ các ván playthrough
+        self.calibration = []
+        self.games = 0
+        self.playthrough_games = 0
+        self.adjudicated = {reason: 0 for reason in REASONS}
+        self.would_resign = 0
+        self.false_resigns = 0
+        self.plies_played = 0
+        # Số nước còn lại sau điểm lẽ ra đã xử, đo trên ván playthrough: [tổng, số lần]
+        self.tails = {reason: [0, 0] for reason in REASONS}
+
+    def new_game(self):
+        self.games += 1
+        playthrough = self.rng.random() < self.playthrough_fraction
+        if playthrough:
+            self.playthrough_games += 1
+        return GameAdjudication(self, playthrough)
+
+    def calibrate(self):
+        # Ngưỡng cao nhất sao cho trong các lần lẽ ra resign (value tệ nhất <= ngưỡng), tỉ lệ bên resign
+        # không thua <= target_false_resign
+        if self.resign_threshold is None or len(self.calibration) < self.min_calibration_samples:
+            return
+        best = None
+        false = 0
+        for i, (worst, not_lost) in enumerate(sorted(self.calibration)):
+            false += not_lost
+            if false / (i + 1) <= self.target_false_resign:
+                best = worst
+        if best is None:
+            # Kể cả value thấp nhất đã thấy cũng resign sai quá nhiều: siết ngưỡng xuống dưới mọi mẫu
+            best = np.nextafter(min(worst for worst, _ in self.calibration), -np.inf)
+        self.resign_threshold = min(float(best), self.max_resign_threshold)
+
+    def false_resign_rate(self):
+        return self.false_resigns / self.would_resign if self.would_resign else 0.0
+
+    def plies_saved(self):
+        # Ước lượng từ ván playthrough: số ván bị xử * số nước trung bình còn lại sau điểm xử
+        saved = 0.0
+        for reason, count in self.adjudicated.items():
+            total, samples = self.tails[reason]
+            if samples:
+                saved += count * total / samples
+        return saved
+
+    def summary(self):
+        adjudicated = ", ".join(f"{reason} {count}" for reason, count in self.adjudicated.items())
+        saved = self.plies_saved()
+        return (f"{self.games} ván ({self.playthrough_games} playthrough), xử sớm: {adjudicated}; "
+                f"resign sai {self.false_resigns}/{self.would_resign} ({self.false_resign_rate() * 100:.1f}%), "
+                f"ngưỡng resign {self.resign_threshold}; tiết kiệm ~{saved:.0f} nước "
+                f"({saved / max(self.games, 1):.1f}/ván, {saved / max(saved + self.plies_played, 1) * 100:.1f}%)")
+
+
+class GameAdjudication:
+    def __init__(self, adjudicator, playthrough):
+        self.adjudicator = adjudicator
+        self.playthrough = playthrough
+        self.recent = {chess.WHITE: [], chess.BLACK: []}  # value gần nhất của mỗi bên
+        self.worst = {chess.WHITE: np.inf, chess.BLACK: np.inf}
+        self.draw_streak = 0
+        self.would = {}  # reason -> (ply, result) lần đầu lẽ ra đã xử (ván playthrough)
+        self.decision = None
+
+    def check(self, board):
+        # Gọi trước khi search: tablebase / giới hạn nước không cần value, thế cờ tablebase khỏi phải search.
+        # Trả về (result, reason) nếu ván được xử, ngược lại None.
+        adj = self.adjudicator
+        ply = len(board.move_stack)
+
+        if adj.tablebase is not None and adj.tablebase.can_probe(board):
+            wdl = adj.tablebase.probe_wdl(board)
+            if wdl is not None:
+                winner = None
+                if wdl >= 2:
+                    winner = board.turn
+                elif wdl <= -2:
+                    winner = not board.turn
+                return self._decide(result_for(winner), TABLEBASE, ply, final=True)
+
+        if adj.max_plies is not None and ply >= adj.max_plies:
+            return self._decide("1/2-1/2", MAX_PLIES, ply, final=True)
+        return None
+
+    def update(self, board, value=None):
+        # Gọi sau search, trước khi đi nước; value theo góc nhìn bên tới lượt (None nếu không có search)
+        adj = self.adjudicator
+        ply = len(board.move_stack)
+        if value is None:
+            return None
+
+        side = board.turn
+        recent = self.recent[side]
+        recent.append(value)
+        del recent[:-adj.resign_moves]
+        # Chỉ tính các nước resign có thể xảy ra, value khai cuộc nhiễu không vào dữ liệu hiệu chỉnh
+        if len(recent) == adj.resign_moves and ply >= adj.min_resign_ply:
+            self.worst[side] = min(self.worst[side], max(recent))
+            if adj.resign_threshold is not None and max(recent) <= adj.resign_threshold:
+                decision = self._decide(result_for(not side), RESIGN, ply)
+                if decision is not None:
+                    return decision
+
+        if adj.draw_threshold is not None:
+            self.draw_streak = self.draw_streak + 1 if abs(value) <= adj.draw_threshold else 0
+            if ply >= adj.min_draw_ply and self.draw_streak >= adj.draw_moves:
+                return self._decide("1/2-1/2", DRAW, ply)
+        return None
+
+    def _decide(self, result, reason, ply, final=False):
+        # Ván playthrough chỉ ghi lại điểm lẽ ra đã xử (trừ tablebase / max_plies: luôn kết thúc)
+        if self.playthrough and not final:
+            self.would.setdefault(reason, (ply, result))
+            return None
+        self.decision = (result, reason)
+        return self.decision
+
+    def finish(self, result, plies):
+        # Gọi một lần khi ván kết thúc (kể cả khi bị xử), result: "1-0" / "0-1" / "1/2-1/2"
+        adj = self.adjudicator
+        adj.plies_played += plies
+        if self.decision is not None:
+            adj.adjudicated[self.decision[1]] += 1
+        if not self.playthrough:
+            return
+
+        for reason, (ply, would_result) in self.would.items():
+            adj.tails[reason][0] += plies - ply
+            adj.tails[reason][1] += 1
+        if RESIGN in self.would:
+            adj.would_resign += 1
+            if self.would[RESIGN][1] != result:
+                adj.false_resigns += 1
+        for side in (chess.WHITE, chess.BLACK):
+            if self.worst[side] < np.inf:
+                adj.calibration.append((self.worst[side], result != result_for(not side)))
+        adj.calibrate()
@@ -0,0 +1,85 @@
+import queue
+import threading
+import time
+from profiler import profiler
+
+
+class EvalRequest:
+    def __init__(self, planes):
+        self.planes = planes
+        self.done = threading.Event()
+        self.policy = None
+        self.value = None
+        self.error = None
+
+
+# Gom các yêu cầu đánh giá (feature plane của lá) từ nhiều thread search thành một batch cho model.predict_planes_batch
+class BatchEvaluator:
+    def __init__(self, model, batch_size=8, timeout=0.001):
+        self.model = model
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+
+        self.batches = 0
+        self.evaluated = 0
+        self.queue_wait = 0.0
+
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def evaluate(self, planes):
+        request = EvalRequest(planes)
+        start = time.time()
+        self.requests.put(request)
+        with profiler.span("eval.queue_wait"):
+            request.done.wait()
+        with self.lock:
+            self.queue_wait += time.time() - start
+        if request.error is not None:
+            raise request.error
+        return request.policy, request.value
+
+    def close(self):
+        self.requests.put(None)
+        self.thread.join()
+
+    def _loop(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            batch = [request]
+            closing = False
+            while len(batch) < self.batch_size:
+                try:
+                    request = self.requests.get(timeout=self.timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    closing = True
+                    break
+                batch.append(request)
+
+            try:
+                with profiler.span("eval.batch"):
+                    policies, values = self.model.predict_planes_batch([r.planes for r in batch])
+            except Exception as error:
+                # Model lỗi: trả lỗi cho từng thread đang chờ thay vì để thread này chết và các thread kia chờ mãi
+                for request in batch:
+                    request.error = error
+                    request.done.set()
+                if closing:
+                    return
+                continue
+            profiler.count("eval.batches")
+            for request, policy, value in zip(batch, policies, values):
+                request.policy = policy
+                request.value = value
+                request.done.set()
+
+            self.batches += 1
+            self.evaluated += len(batch)
+            if closing:
+                return
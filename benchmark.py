@@ -0,0 +1,284 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import chess
+import numpy as np
+import torch
+
+from model import AlphaZeroNet, get_device
+from mcts import MCTS, thread_scaling, check_tree
+from utils import board_to_tensor, move_to_index
+from features import root_features, child_features
+
+# Bộ thế cờ cố định cho benchmark: khai cuộc, trung cuộc, tàn cuộc
+FEN_SUITE = [
+    chess.STARTING_FEN,
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "8/8/4k3/8/2P5/8/4K3/8 w - - 0 1",
+]
+
+SECTIONS = ["encoder", "move_index", "predict", "mcts", "mcts_threads", "selfplay", "trainer", "startup"]
+
+# Module đo thời gian import trong section startup (mỗi lần một interpreter mới)
+STARTUP_MODULES = ["model", "mcts", "training", "evalute_elo", "uci"]
+
+# Chênh lệch tối đa so với baseline trước khi coi là regression
+DEFAULT_TOLERANCE = 0.10
+
+
+def timed_rate(fn, items, min_time=1.0):
+    # Lặp fn trên items tới khi đủ min_time, trả về số item/giây
+    count = 0
+    start = time.perf_counter()
+    while True:
+        for item in items:
+            fn(item)
+        count += len(items)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return count / elapsed
+
+
+def bench_encoder(boards, args):
+    # Encoder đầy đủ và encoder tăng dần (plane của con từ plane của cha + nước đi) như trong MCTS
+    children = []
+    for board in boards:
+        parent = root_features(board)
+        for move in board.legal_moves:
+            child = board.copy()
+            child.push(move)
+            children.append((parent, board, move, child))
+    return {
+        "encoder.positions_per_sec": timed_rate(board_to_tensor, boards, args.min_time),
+        "encoder.incremental_per_sec": timed_rate(lambda c: child_features(*c), children, args.min_time),
+    }
+
+
+def bench_move_index(boards, args):
+    moves = [move for board in boards for move in board.legal_moves]
+    return {"move_index.ops_per_sec": timed_rate(move_to_index, moves, args.min_time)}
+
+
+def bench_predict(model, boards, args):
+    results = {}
+    for batch_size in args.batch_sizes:
+        batch = [boards[i % len(boards)] for i in range(batch_size)]
+        model.predict_batch(batch)  # warm-up
+        runs = 0
+        start = time.perf_counter()
+        while runs < 3 or time.perf_counter() - start < args.min_time:
+            model.predict_batch(batch)
+            runs += 1
+        latency = (time.perf_counter() - start) / runs
+        results[f"predict.batch_{batch_size}.latency_ms"] = latency * 1000
+        results[f"predict.batch_{batch_size}.positions_per_sec"] = batch_size / latency
+    return results
+
+
+def bench_mcts(model, boards, args):
+    simulations = 0
+    elapsed = 0.0
+    for board in boards:
+        mcts = MCTS(model, time_limit=None, num_threads=args.threads, batch_size=args.mcts_batch_size)
+        start = time.perf_counter()
+        mcts.search(board, max_simulations=args.simulations)
+        elapsed += time.perf_counter() - start
+        simulations += mcts.simulations
+        check_tree(mcts.root)
+        if mcts.root.visit_count != mcts.simulations:
+            raise AssertionError(f"root visits {mcts.root.visit_count} != simulations {mcts.simulations}")
+    return {"mcts.nps": simulations / elapsed}
+
+
+def bench_mcts_threads(model, boards, args):
+    scaling = thread_scaling(model, boards[0], args.min_time, args.max_threads, args.mcts_batch_size)
+    return {f"mcts_threads.threads_{n}.nps": nps for n, nps in scaling.items()}
+
+
+def bench_selfplay(model, args):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    from self_play import SelfPlay
+
+    sp = SelfPlay(model, time_limit=args.selfplay_time, board=chess.Board())
+    start = time.perf_counter()
+    game_data, _ = sp.play_game(max_moves=args.selfplay_plies)
+    elapsed = time.perf_counter() - start
+    # Chỉ nước search đầy đủ được lưu làm sample (playout-cap randomization)
+    return {
+        "selfplay.plies_per_sec": len(sp.board.move_stack) / elapsed,
+        "selfplay.samples_per_sec": len(game_data) / elapsed,
+    }
+
+
+def bench_trainer(model, boards, args):
+    from training import AlphaZeroTrainer
+
+    samples = []
+    rng = np.random.default_rng(0)
+    for i in range(args.train_samples):
+        policy = rng.random(4672).astype(np.float32)
+        samples.append((board_to_tensor(boards[i % len(boards)]), policy / policy.sum(), float(rng.uniform(-1, 1))))
+    trainer = AlphaZeroTrainer(model, epochs=1, batch_size=args.train_batch_size)
+    start = time.perf_counter()
+    trainer.train(samples)
+    return {"trainer.samples_per_sec": len(samples) / (time.perf_counter() - start)}
+
+
+def run_python(code, runs, reported=False):
+    # Chạy code trong interpreter mới, trả về trung vị thời gian (giây) của runs lần:
+    # thời gian cả process, hoặc số do chính code in ra ở dòng cuối nếu reported
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy")
+    env.pop("CHESS_AI_PROFILE", None)
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env, check=True, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        times.append(float(out.stdout.strip().splitlines()[-1]) if reported else elapsed)
+    return sorted(times)[len(times) // 2]
+
+
+def bench_startup(args):
+    results = {}
+    for module in STARTUP_MODULES:
+        results[f"startup.import_{module}_ms"] = run_python(f"import {module}", args.startup_runs) * 1000
+
+    # Frame menu đầu tiên của GUI (main.py dựng cửa sổ khi import)
+    first_frame = (
+        "import pygame, main\n"
+        "from menu_screen import MenuScreen\n"
+        "menu = MenuScreen(main.screen, main.start_pvp, main.start_pvc)\n"
+        "menu.menu.draw(main.screen)\n"
+        "pygame.display.update()\n"
+    )
+    results["startup.first_menu_frame_ms"] = run_python(first_frame, args.startup_runs) * 1000
+
+    # Worker self-play: từ lúc start() tới khi process chạy xong hàm target, cùng start method với training
+    # (worker đầu tiên gồm cả khởi động forkserver; respawn = worker tiếp theo, vd khi khởi động lại worker chết)
+    spawn = (
+        "import time, training\n"
+        "ctx = training.worker_context()\n"
+        "times = []\n"
+        "for _ in range(2):\n"
+        "    p = ctx.Process(target=training.replay_store_dir, args=(0,))\n"
+        "    start = time.perf_counter(); p.start(); p.join(); times.append(time.perf_counter() - start)\n"
+        "print(times[{}])\n"
+    )
+    results["startup.worker_spawn_ms"] = run_python(spawn.format(0), args.startup_runs, reported=True) * 1000
+    results["startup.worker_respawn_ms"] = run_python(spawn.format(1), args.startup_runs, reported=True) * 1000
+    return results
+
+
+def run(args):
+    torch.manual_seed(0)
+    boards = [chess.Board(fen) for fen in FEN_SUITE]
+    model = AlphaZeroNet(n_res_blocks=args.blocks).to(get_device())
+    model.eval()
+
+    results = {}
+    for section in args.sections:
+        print(f"[bench] {section}...", file=sys.stderr)
+        if section == "encoder":
+            results.update(bench_encoder(boards, args))
+        elif section == "move_index":
+            results.update(bench_move_index(boards, args))
+        elif section == "predict":
+            results.update(bench_predict(model, boards, args))
+        elif section == "mcts":
+            results.update(bench_mcts(model, boards, args))
+        elif section == "mcts_threads":
+            results.update(bench_mcts_threads(model, boards, args))
+        elif section == "selfplay":
+            results.update(bench_selfplay(model, args))
+        elif section == "trainer":
+            results.update(bench_trainer(model, boards, args))
+        elif section == "startup":
+            results.update(bench_startup(args))
+    return results
+
+
+def higher_is_better(metric):
+    return not metric.endswith("_ms")
+
+
+def compare(results, baseline, tolerance):
+    # In bảng so sánh, trả về danh sách metric bị regression
+    regressions = []
+    for metric, value in sorted(results.items()):
+        base = baseline.get(metric)
+        if not base:
+            print(f"{metric:45s} {value:14.2f}")
+            continue
+        change = (value - base) / base if higher_is_better(metric) else (base - value) / base
+        flag = ""
+        if change < -tolerance:
+            flag = "  REGRESSION"
+            regressions.append(metric)
+        print(f"{metric:45s} {value:14.2f}  baseline {base:14.2f}  {change * 100:+7.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark encoder, move index, inference, MCTS, self-play, training")
+    parser.add_argument("--sections", default=",".join(s for s in SECTIONS if s != "mcts_threads"),
+                        help=f"danh sách section, phân tách bởi dấu phẩy: {','.join(SECTIONS)}")
+    parser.add_argument("--blocks", type=int, default=19, help="số residual block của model")
+    parser.add_argument("--min-time", type=float, default=1.0, help="thời gian tối thiểu mỗi phép đo (giây)")
+    parser.add_argument("--batch-sizes", default="1,8,64,256")
+    parser.add_argument("--simulations", type=int, default=200, help="số simulation MCTS mỗi thế cờ")
+    parser.add_argument("--threads", type=int, default=1, help="số thread cho section mcts")
+    parser.add_argument("--max-threads", type=int, default=os.cpu_count() or 1, help="cho section mcts_threads")
+    parser.add_argument("--mcts-batch-size", type=int, default=8)
+    parser.add_argument("--selfplay-time", type=float, default=0.1)
+    parser.add_argument("--selfplay-plies", type=int, default=20)
+    parser.add_argument("--train-samples", type=int, default=512)
+    parser.add_argument("--train-batch-size", type=int, default=64)
+    parser.add_argument("--startup-runs", type=int, default=3, help="số lần chạy mỗi phép đo startup")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", help="file JSON kết quả cũ để so sánh")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+    args.sections = [s for s in args.sections.split(",") if s]
+    args.batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+
+    unknown = set(args.sections) - set(SECTIONS)
+    if unknown:
+        parser.error(f"unknown sections: {', '.join(sorted(unknown))}")
+
+    results = run(args)
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "device": str(get_device()),
+            "torch_threads": torch.get_num_threads(),
+            "cpu_count": os.cpu_count(),
+            "blocks": args.blocks,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.tolerance)
+    print(f"Saved results to {args.output}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) vs {args.baseline}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
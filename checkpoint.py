@@ -0,0 +1,139 @@
+import os
+import glob
+import queue
+import random
+import threading
+import numpy as np
+import torch
+from profiler import profiler
+
+
+# Checkpoint đầy đủ để resume: model, optimizer, scheduler, RNG, iteration và con trỏ replay.
+# State được chụp (copy sang CPU) trên thread gọi, việc ghi đĩa chạy ở thread nền để không chặn training.
+CHECKPOINT_DIR = "checkpoints"
+KEEP_LAST = 3
+
+
+def _to_cpu(obj):
+    # Copy sâu, tensor chuyển về CPU để thread nền ghi trong khi training tiếp tục cập nhật tensor gốc
+    if torch.is_tensor(obj):
+        return obj.detach().cpu().clone()
+    if isinstance(obj, dict):
+        return {key: _to_cpu(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(value) for value in obj)
+    return obj
+
+
+def rng_state():
+    state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+class CheckpointManager:
+    def __init__(self, directory=CHECKPOINT_DIR, keep_last=KEEP_LAST, prefix="ckpt"):
+        self.directory = directory
+        self.keep_last = keep_last  # None = giữ tất cả
+        self.prefix = prefix
+        os.makedirs(directory, exist_ok=True)
+        self.jobs = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def path_for(self, iteration):
+        return os.path.join(self.directory, f"{self.prefix}_{iteration:08d}.pt")
+
+    def checkpoints(self):
+        return sorted(glob.glob(os.path.join(self.directory, f"{self.prefix}_*.pt")))
+
+    def latest(self):
+        paths = self.checkpoints()
+        return paths[-1] if paths else None
+
+    def save(self, iteration, trainer, sampler=None, extra=None, blocking=False):
+        if self.error is not None:
+            raise RuntimeError(f"Lần ghi checkpoint trước bị lỗi: {self.error}")
+        with profiler.span("checkpoint.snapshot"):
+            state = {
+                "iteration": iteration,
+                "model": _to_cpu(trainer.model.state_dict()),
+                "optimizer": _to_cpu(trainer.optimizer.state_dict()),
+                "scheduler": _to_cpu(trainer.scheduler.state_dict()) if trainer.scheduler is not None else None,
+                "rng": rng_state(),
+                "replay": sampler.state_dict() if sampler is not None else None,
+                "extra": extra or {},
+            }
+        path = self.path_for(iteration)
+        self.jobs.put((path, state))
+        if blocking:
+            self.wait()
+        return path
+
+    def wait(self):
+        self.jobs.join()
+        if self.error is not None:
+            raise RuntimeError(f"Ghi checkpoint lỗi: {self.error}")
+
+    def close(self):
+        self.wait()
+        self.jobs.put(None)
+        self.thread.join()
+
+    def load(self, trainer, sampler=None, path=None):
+        # Trả về state đã nạp (iteration, extra, ...) hoặc None nếu chưa có checkpoint
+        path = path or self.latest()
+        if path is None:
+            return None
+        state = torch.load(path, map_location="cpu", weights_only=False)
+        trainer.model.load_state_dict(state["model"])
+        trainer.optimizer.load_state_dict(state["optimizer"])
+        if trainer.scheduler is not None and state["scheduler"] is not None:
+            trainer.scheduler.load_state_dict(state["scheduler"])
+        set_rng_state(state["rng"])
+        if sampler is not None and state["replay"] is not None:
+            sampler.load_state_dict(state["replay"])
+        print(f"[Checkpoint] Resume từ {path} (iteration {state['iteration']})")
+        return state
+
+    def _loop(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                return
+            path, state = job
+            try:
+                with profiler.span("checkpoint.write"):
+                    tmp_path = path + ".tmp"
+                    torch.save(state, tmp_path)
+                    os.replace(tmp_path, path)
+                self._prune()
+            except Exception as e:
+                self.error = e
+                print(f"[Error] Lỗi khi ghi checkpoint '{path}': {e}")
+            finally:
+                self.jobs.task_done()
+
+    def _prune(self):
+        if not self.keep_last:
+            return
+        for path in self.checkpoints()[:-self.keep_last]:
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"[Warning] Không thể xóa checkpoint cũ '{path}': {e}")
@@ -0,0 +1,156 @@
+import io
+import os
+import time
+import socket
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.nn.parallel import DistributedDataParallel
+
+from model import AlphaZeroNet, get_device
+from training import AlphaZeroTrainer
+from replay_buffer import ReplayStore, ReplaySampler
+from profiler import profiler
+
+# Train data-parallel trên nhiều process CPU (torch.distributed, backend gloo, localhost).
+# Mỗi rank lấy batch_size / world_size sample từ replay store, DDP trung bình gradient giữa các rank.
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def default_threads(world_size):
+    return max(1, (os.cpu_count() or 1) // world_size)
+
+
+def setup_rank(rank, world_size, port, threads_per_rank):
+    os.environ["MASTER_ADDR"] = "127.0.0.1"
+    os.environ["MASTER_PORT"] = str(port)
+    # Mỗi rank dùng một phần số core, tránh các rank tranh nhau intra-op thread
+    torch.set_num_threads(threads_per_rank)
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+
+
+def _train_rank(rank, world_size, port, threads_per_rank, n_res_blocks, state, store_dirs, window,
+                epochs, batch_size, learning_rate, seed, result_queue):
+    setup_rank(rank, world_size, port, threads_per_rank)
+    try:
+        # Mỗi rank dựng model + optimizer riêng từ bytes: tensor truyền qua args của mp.spawn nằm trong shared
+        # memory, các rank sẽ cùng cập nhật một bộ trọng số (bước update bị cộng world_size lần)
+        model_state, optimizer_state = torch.load(io.BytesIO(state), map_location="cpu")
+        model = AlphaZeroNet(n_res_blocks=n_res_blocks)
+        model.load_state_dict(model_state)
+        trainer = AlphaZeroTrainer(model, epochs=epochs, batch_size=batch_size // world_size,
+                                   learning_rate=learning_rate)
+        trainer.model.cpu()
+        trainer.optimizer.load_state_dict(optimizer_state)
+        trainer.forward_model = DistributedDataParallel(trainer.model)
+        trainer.verbose = rank == 0
+
+        stores = [ReplayStore(directory, mode="r") for directory in store_dirs]
+        sampler = ReplaySampler(stores, window=window, seed=seed + rank)
+        # Số bước mỗi epoch tính theo batch toàn cục để khối lượng train giống chế độ một process
+        num_batches = max(1, len(sampler) // batch_size)
+        trainer.train_from_sampler(sampler, num_batches)
+
+        if rank == 0:
+            # Gửi dạng bytes: tensor qua queue dùng shared memory fd, hết hạn khi rank thoát
+            buffer = io.BytesIO()
+            torch.save((trainer.model.state_dict(), trainer.optimizer.state_dict()), buffer)
+            result_queue.put(buffer.getvalue())
+    finally:
+        dist.destroy_process_group()
+
+
+def train_data_parallel(trainer, store_dirs, world_size, window=None, threads_per_rank=None, seed=0):
+    # Train một iteration trên world_size process rồi nạp lại model + optimizer của rank 0 vào trainer
+    threads_per_rank = threads_per_rank or default_threads(world_size)
+    ctx = mp.get_context("spawn")
+    result_queue = ctx.SimpleQueue()
+    state = io.BytesIO()
+    torch.save((trainer.model.state_dict(), trainer.optimizer.state_dict()), state)
+    n_res_blocks = len(trainer.model.res_blocks)
+    with profiler.span("train.data_parallel"):
+        context = mp.spawn(
+            _train_rank,
+            args=(world_size, free_port(), threads_per_rank, n_res_blocks, state.getvalue(), store_dirs,
+                  window, trainer.epochs, trainer.batch_size, trainer.learning_rate, seed, result_queue),
+            nprocs=world_size,
+            join=False,
+        )
+        # Đọc kết quả trong lúc chờ join: rank 0 bị chặn ở put() cho tới khi pipe được đọc,
+        # còn join() ném lỗi ngay nếu một rank chết trước khi gửi
+        result = None
+        while True:
+            if result is None and not result_queue.empty():
+                result = result_queue.get()
+            if context.join(timeout=0.1):
+                break
+        if result is None:
+            result = result_queue.get()
+    model_state, optimizer_state = torch.load(io.BytesIO(result), map_location="cpu")
+    trainer.model.load_state_dict(model_state)
+    trainer.model.to(get_device())
+    trainer.optimizer.load_state_dict(optimizer_state)
+    if trainer.scheduler is not None:
+        trainer.scheduler.step()
+
+
+def _scaling_rank(rank, world_size, port, threads_per_rank, n_res_blocks, global_batch, steps, result_queue):
+    setup_rank(rank, world_size, port, threads_per_rank)
+    try:
+        torch.manual_seed(rank)
+        model = AlphaZeroNet(n_res_blocks=n_res_blocks)
+        trainer = AlphaZeroTrainer(model, batch_size=global_batch // world_size)
+        trainer.model.cpu()
+        trainer.forward_model = DistributedDataParallel(trainer.model)
+        batch = trainer.batch_size
+        states = torch.randint(0, 2, (batch, 20, 8, 8)).float()
+        policies = torch.softmax(torch.randn(batch, 4672), dim=1)
+        values = torch.rand(batch) * 2 - 1
+
+        trainer.train_batch(states, policies, values)  # khởi động
+        dist.barrier()
+        start = time.time()
+        for _ in range(steps):
+            trainer.train_batch(states, policies, values)
+        dist.barrier()
+        if rank == 0:
+            result_queue.put(steps * global_batch / (time.time() - start))
+    finally:
+        dist.destroy_process_group()
+
+
+def rank_scaling(max_ranks, n_res_blocks=19, global_batch=64, steps=10, threads_per_rank=None):
+    # samples/giây của một bước train với batch toàn cục cố định, từ 1 đến max_ranks rank
+    ctx = mp.get_context("spawn")
+    results = {}
+    for world_size in range(1, max_ranks + 1):
+        threads = threads_per_rank or default_threads(world_size)
+        result_queue = ctx.SimpleQueue()
+        mp.spawn(_scaling_rank, args=(world_size, free_port(), threads, n_res_blocks, global_batch, steps,
+                                      result_queue), nprocs=world_size)
+        results[world_size] = (threads, result_queue.get())
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Đo hiệu quả scale của train data-parallel theo số rank")
+    parser.add_argument("--ranks", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=None, help="số thread mỗi rank (mặc định: số core / số rank)")
+    parser.add_argument("--blocks", type=int, default=19)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--steps", type=int, default=10)
+    args = parser.parse_args()
+
+    scaling = rank_scaling(args.ranks, args.blocks, args.batch_size, args.steps, args.threads)
+    base = scaling[1][1]
+    for world_size, (threads, samples_per_sec) in scaling.items():
+        speedup = samples_per_sec / base
+        print(f"ranks={world_size:3d}  threads/rank={threads:3d}  samples/s={samples_per_sec:8.1f}  "
+              f"speedup={speedup:.2f}x  efficiency={speedup / world_size * 100:5.1f}%")
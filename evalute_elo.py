@@ -1,14 +1,13 @@
 import chess
 import chess.engine
-import torch
-import random
 import math
+import time
 from tqdm import tqdm
-from model import AlphaZeroNet
+import model_registry
 from mcts import MCTS
-from utils import board_to_tensor, index_to_move, move_to_index
-import os
-import numpy as np
+from probe import open_book, open_tablebase
+from adjudication import Adjudicator
+from utils import index_to_move, move_to_index
 
 # Đường dẫn tới Stockfish
 STOCKFISH_PATH = "./stockfish/stockfish-windows-x86-64-avx2"  # Đổi nếu cần
@@ -20,25 +19,39 @@ STOCKFISH_ELO = 2300  # Mức thấp nhất mà Stockfish hỗ trợ
 NUM_GAMES = 10
 TIME_LIMIT = 10.0
 
-#Model train by data_from_stockfish
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model = AlphaZeroNet().to(device)
-model_path = 'model_4.pt'
-if os.path.exists(model_path):
-    model.load_state_dict(torch.load(model_path, map_location=device))
+# Đồng hồ ván đấu cho model (giây); None = dùng TIME_LIMIT cố định mỗi nước
+GAME_TIME = None
+INCREMENT = 0.0
+
+# Sách khai cuộc Polyglot / thư mục Syzygy cho model (None = không dùng)
+BOOK_PATH = None
+SYZYGY_PATH = None
+book = open_book(BOOK_PATH)
+tablebase = open_tablebase(SYZYGY_PATH)
+skipped_searches = 0
+
+# Xử sớm ván: model resign theo value của chính nó, hòa theo value, giới hạn nước, tablebase (None = đánh hết ván)
+ADJUDICATE = True
+adjudicator = Adjudicator(tablebase=tablebase, playthrough_fraction=0.1) if ADJUDICATE else None
+
+#Model train by data_from_stockfish (model_4.pt), chỉ nạp khi ván đầu tiên cần tới
+def get_model():
+    return model_registry.get_model("stockfish")
 
 def get_best_move(board: chess.Board) -> str:
-    policy, value = model.predict(board)
+    policy, value = get_model().predict(board)
     legal_indices = [move_to_index(move) for move in board.legal_moves]
     best_index = max(legal_indices, key=lambda idx: policy[idx])
     best_move = index_to_move(board, best_index)
     return best_move
 
-# Hàm chọn nước đi từ model
-def get_model_move(board: chess.Board) -> str:
-    mcts = MCTS(model, time_limit=TIME_LIMIT)
-    move = mcts.search(board)
-    return move.uci()
+# Hàm chọn nước đi từ model, kèm value của search (góc nhìn model, None nếu đi theo sách / tablebase)
+def get_model_move(board: chess.Board, remaining=None):
+    global skipped_searches
+    mcts = MCTS(get_model(), time_limit=TIME_LIMIT, book=book, tablebase=tablebase)
+    move = mcts.search(board, remaining=remaining, increment=INCREMENT)
+    skipped_searches += mcts.skipped_searches
+    return move.uci(), mcts.root_value()
 
 # Ước lượng chênh lệch Elo từ tỉ lệ thắng
 def estimate_elo(score_ratio):
@@ -51,15 +64,33 @@ def estimate_elo(score_ratio):
 # Chơi 1 ván giữa model và Stockfish
 def play_game(engine, model_as_white=True):
     board = chess.Board()
+    model_clock = GAME_TIME
+    game = adjudicator.new_game() if adjudicator is not None else None
+    decision = None
     while not board.is_game_over():
+        # Tablebase / giới hạn nước: xử trước khi model hoặc Stockfish phải tính
+        if game is not None:
+            decision = game.check(board)
+            if decision is not None:
+                break
         if (board.turn == chess.WHITE and model_as_white) or (board.turn == chess.BLACK and not model_as_white):
-            move_uci = get_model_move(board)
+            start = time.time()
+            move_uci, value = get_model_move(board, remaining=model_clock)
+            if model_clock is not None:
+                model_clock = max(model_clock - (time.time() - start), 0.0) + INCREMENT
         else:
             result = engine.play(board, chess.engine.Limit(time=0.05))  # Giới hạn suy nghĩ
             move_uci = result.move.uci()
+            value = None
+        if game is not None:
+            decision = game.update(board, value)
+            if decision is not None:
+                break
         board.push_uci(move_uci)
 
-    result = board.result()
+    result = decision[0] if decision is not None else board.result()
+    if game is not None:
+        game.finish(result, len(board.move_stack))
     if result == "1-0":
         return 1 if model_as_white else 0
     elif result == "0-1":
@@ -68,6 +99,7 @@ def play_game(engine, model_as_white=True):
         return 0.5
     
 def model_get_best_move(board):
+    engine = None
     try:
         engine = chess.engine.SimpleEngine.popen_uci('./stockfish/stockfish-windows-x86-64-avx2.exe')
         engine.configure({
@@ -80,6 +112,9 @@ def model_get_best_move(board):
     except Exception as e:
         print(f"[ERROR] in playEngineMove: {e}")
         return None
+    finally:
+        if engine is not None:
+            engine.quit()
 
 # Hàm chính
 def main():
@@ -107,6 +142,10 @@ def main():
     print(f"\n✅ Tỉ lệ thắng của model: {score_ratio * 100:.2f}%")
     print(f"📈 Chênh lệch Elo ước lượng: {elo_diff:.1f}")
     print(f"🏅 Elo ước lượng của model: {estimated_elo:.1f}")
+    if book is not None or tablebase is not None:
+        print(f"📚 Bỏ qua {skipped_searches} lần search nhờ sách khai cuộc / tablebase")
+    if adjudicator is not None:
+        print(f"⚖️ Adjudication: {adjudicator.summary()}")
 
     
 
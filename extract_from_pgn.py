@@ -4,21 +4,37 @@ import numpy as np
 import os
 import torch
 from utils import board_to_tensor, move_to_index  # Đảm bảo các hàm này đã được định nghĩa
-from multiprocessing import Process
+from multiprocessing import Process, Queue
 from replay_buffer import save_buffer
+from pgn_stream import stream_games, read_games, queued_games
+from position_sampler import PositionSampler, DEFAULT_PHASE_QUOTA, SEEN_FILE, load_seen
 
 TIME_LIMIT = 3.0
 games_per_chunk = 5
+WORKERS_PER_FILE = 1  # số worker chia nhau một file PGN (một process đọc file, đưa ván qua queue)
+QUEUE_GAMES_PER_WORKER = 16  # số ván tối đa nằm chờ trong queue cho mỗi worker
 
-def get_stockfish_policy(board, engine, time_limit=TIME_LIMIT, top_k=20):
+# Lọc theo header trước khi parse nước đi (None = không giới hạn),
+# vd pgn_stream.HeaderFilter(min_elo=1800, min_seconds=180, results=["1-0", "0-1", "1/2-1/2"])
+HEADER_FILTER = None
+
+# Chọn thế cờ trước khi gửi Stockfish (xem position_sampler.py)
+POSITIONS_PER_GAME = 8
+SKIP_OPENING_PLIES = 10
+PHASE_QUOTA = DEFAULT_PHASE_QUOTA
+
+def get_stockfish_labels(board, engine, time_limit=TIME_LIMIT, top_k=20):
+    # Policy và value từ cùng một lần phân tích multipv: value lấy theo dòng tốt nhất
     policy = np.zeros(4672, dtype=np.float32)
+    value = None
     try:
         legal_moves = list(board.legal_moves)
         if not legal_moves:
-            return policy
+            return policy, get_stockfish_value(board, engine, time_limit)
 
         multipv = min(top_k, len(legal_moves))
         info = engine.analyse(board, chess.engine.Limit(time=time_limit), multipv=multipv)
+        value = score_to_value(info[0]["score"], board.turn)
 
         scores = []
         moves = []
@@ -34,7 +50,7 @@ def get_stockfish_policy(board, engine, time_limit=TIME_LIMIT, top_k=20):
             moves.append(move)
 
         if not scores:
-            return policy
+            return policy, value
 
         scores = np.array(scores, dtype=np.float32)
         temperature = 0.5
@@ -50,8 +66,17 @@ def get_stockfish_policy(board, engine, time_limit=TIME_LIMIT, top_k=20):
                 print(f"[ERROR] move_to_index({move}): {e}")
     except Exception as e:
         print(f"[Lỗi phân tích Stockfish]: {e}")
-    
-    return policy
+
+    if value is None:
+        value = get_stockfish_value(board, engine, time_limit)
+    return policy, value
+
+def score_to_value(score, turn):
+    try:
+        pov_wdl = score.wdl().pov(turn)
+        return float((pov_wdl.wins - pov_wdl.losses) / 1000.0)
+    except Exception:
+        return float(np.tanh(score.pov(turn).score(mate_score=10000) / 400.0))
 
 def get_stockfish_value(board, engine, time_limit=TIME_LIMIT):
     try:
@@ -69,69 +94,71 @@ def get_stockfish_value(board, engine, time_limit=TIME_LIMIT):
         except:
             return 0.0
 
-def process_pgn_with_stockfish(pgn_path, save_dir, stockfish_path):
+def read_progress(progress_path):
+    # progress.txt: "<game_index tiếp theo trong file> <số ván đã xử lý>" (file cũ chỉ có một số)
+    if not os.path.exists(progress_path):
+        return 0, 0
+    with open(progress_path, 'r') as pf:
+        try:
+            values = [int(v) for v in pf.read().split()]
+        except ValueError:
+            return 0, 0
+    if not values:
+        return 0, 0
+    return values[0], values[-1]
+
+def process_pgn_with_stockfish(pgn_path, save_dir, stockfish_path, worker_id=0, game_queue=None, header_filter=None):
+    # game_queue: nhận ván từ process đọc chung (read_games) thay vì tự đọc file; header_filter khi đó đã áp ở process đọc
     os.makedirs(save_dir, exist_ok=True)
     progress_path = os.path.join(save_dir, "progress.txt")
     engine = chess.engine.SimpleEngine.popen_uci(stockfish_path)
 
     
     chunk_data = []
-    game_count = 0
-    if os.path.exists(progress_path):
-        with open(progress_path, 'r') as pf:
-            try:
-                game_count = int(pf.read().strip())
-            except:
-                game_count = 0
-    skip_count = game_count  # số lượng game cần bỏ qua ban đầu
-    current_game_index = 0
-    chunk_idx = game_count // 5
-
-    with open(pgn_path, 'r', encoding='utf-8') as f:
-        while True:
-            game = chess.pgn.read_game(f)
-            if not game:
-                break
-            if current_game_index < skip_count:
-                current_game_index += 1
-                continue
-            print(f'Start from game {current_game_index}')
-            try:
-                board = game.board()
-                game_data = []
-                print(f'Đang xử lý game {game_count + 1}')
-
-                for move in game.mainline_moves():
-                    policy = get_stockfish_policy(board, engine)
-                    value = get_stockfish_value(board, engine)
-                    state = board_to_tensor(board)
-                    print(f'policy: {policy}')
-                    print(f'sum policy: {sum(policy)}')
-                    print(f'num 1 in policy {np.sum(policy == 1)}')
-                    print(f'num >0.9 in policy {np.sum(policy >= 0.9)}')
-                    print(f'num >0.5 in policy: {np.sum(policy >= 0.5)}')
-                    print(f'num <0.05 in policy: {np.sum(policy <= 0.05)}')
-                    print(f'value: {value}')
-                    game_data.append((state, policy, value))
-                    board.push(move)
-
-                chunk_data.extend(game_data)
-                game_count += 1
-                print(f"[{os.path.basename(pgn_path)}] Đã xử lý ván {game_count}")
-
-                if game_count % games_per_chunk == 0:
-                    save_chunk(chunk_data, save_dir, chunk_idx)
-                    with open(progress_path, 'w') as pf:
-                        pf.write(str(game_count))
-                    chunk_idx += 1
-                    chunk_data = []
-
-            except Exception as e:
-                print(f"Lỗi ở ván {game_count}: {e}")
+    next_index, game_count = read_progress(progress_path)
+    chunk_idx = game_count // games_per_chunk
+    print(f'Start from game {next_index}')
+
+    # Bỏ các thế cờ đã gán nhãn ở mọi thư mục trong save_dir cha (file / worker khác, lần chạy trước)
+    sampler = PositionSampler(POSITIONS_PER_GAME, SKIP_OPENING_PLIES, PHASE_QUOTA,
+                              seen=load_seen(os.path.dirname(os.path.abspath(save_dir))),
+                              seen_path=os.path.join(save_dir, SEEN_FILE), seed=worker_id)
+
+    if game_queue is not None:
+        games = queued_games(game_queue)
+    else:
+        games = stream_games(pgn_path, header_filter, next_index)
+    for game_index, game in games:
+        try:
+            game_data = []
+            for board in sampler.select(game):
+                policy, value = get_stockfish_labels(board, engine)
+                state = board_to_tensor(board)
+                game_data.append((state, policy, value))
+
+            chunk_data.extend(game_data)
+            game_count += 1
+            print(f"[{os.path.basename(pgn_path)}] Đã xử lý ván {game_count} (ván {game_index} trong file, "
+                  f"{len(game_data)} thế cờ)")
+
+            if game_count % games_per_chunk == 0:
+                save_chunk(chunk_data, save_dir, chunk_idx)
+                sampler.save_seen()
+                with open(progress_path, 'w') as pf:
+                    pf.write(f"{game_index + 1} {game_count}")
+                chunk_idx += 1
+                chunk_data = []
+
+        except Exception as e:
+            print(f"Lỗi ở ván {game_count}: {e}")
 
     if chunk_data:
         save_chunk(chunk_data, save_dir, chunk_idx)
+    sampler.save_seen()
 
+    print(f"[{os.path.basename(pgn_path)}] Chọn thế cờ: {sampler.stats()}")
+    if header_filter is not None:
+        print(f"[{os.path.basename(pgn_path)}] Lọc header: nhận {header_filter.accepted}, bỏ {header_filter.rejected}")
     engine.quit()
     print(f"[{os.path.basename(pgn_path)}] Hoàn thành!")
 
@@ -142,13 +169,32 @@ def save_chunk(chunk_data, save_dir, chunk_idx):
     save_buffer(data, file_path)
     print(f"Đã lưu chunk {chunk_idx} vào {file_path}")
 
-def run_in_parallel(pgn_paths, save_dir, stockfish_path):
+def run_in_parallel(pgn_paths, save_dir, stockfish_path, workers_per_file=WORKERS_PER_FILE, header_filter=HEADER_FILTER):
+    # Mỗi file .pgn / .pgn.zst / .pgn.bz2 được đọc trực tiếp; nhiều worker một file thì một process đọc
+    # (giải nén một lần) chia ván qua queue
     processes = []
     for i, pgn_path in enumerate(pgn_paths):
         file_save_dir = os.path.join(save_dir, f"file_{i+7}")
-        p = Process(target=process_pgn_with_stockfish, args=(pgn_path, file_save_dir, stockfish_path))
-        processes.append(p)
-        p.start()
+        if workers_per_file == 1:
+            p = Process(target=process_pgn_with_stockfish,
+                        args=(pgn_path, file_save_dir, stockfish_path, 0, None, header_filter))
+            processes.append(p)
+            p.start()
+            continue
+
+        worker_dirs = [f"{file_save_dir}_{worker_id}" for worker_id in range(workers_per_file)]
+        # Ván của mỗi worker không liên tục: đọc lại từ ván nhỏ nhất chưa chắc đã lưu, thế cờ đã gán nhãn
+        # được PositionSampler bỏ qua
+        start_index = min(read_progress(os.path.join(d, "progress.txt"))[0] for d in worker_dirs)
+        game_queue = Queue(maxsize=QUEUE_GAMES_PER_WORKER * workers_per_file)
+        reader = Process(target=read_games, args=(pgn_path, game_queue, workers_per_file, header_filter, start_index))
+        processes.append(reader)
+        reader.start()
+        for worker_id, worker_dir in enumerate(worker_dirs):
+            p = Process(target=process_pgn_with_stockfish,
+                        args=(pgn_path, worker_dir, stockfish_path, worker_id, game_queue))
+            processes.append(p)
+            p.start()
 
     for p in processes:
         p.join()
@@ -156,12 +202,12 @@ def run_in_parallel(pgn_paths, save_dir, stockfish_path):
 if __name__ == "__main__":
     print("Start đa tiến trình...")
     pgn_files = [
-        "./lichess_db_standard_rated_2014-07.pgn",
-        "./lichess_db_standard_rated_2014-08.pgn",
-        "./lichess_db_standard_rated_2014-09.pgn",
-        "./lichess_db_standard_rated_2014-10.pgn",
-        "./lichess_db_standard_rated_2014-11.pgn",
-        "./lichess_db_standard_rated_2014-12.pgn"
+        "./lichess_db_standard_rated_2014-07.pgn.zst",
+        "./lichess_db_standard_rated_2014-08.pgn.zst",
+        "./lichess_db_standard_rated_2014-09.pgn.zst",
+        "./lichess_db_standard_rated_2014-10.pgn.zst",
+        "./lichess_db_standard_rated_2014-11.pgn.zst",
+        "./lichess_db_standard_rated_2014-12.pgn.zst"
     ]
 
     run_in_parallel(
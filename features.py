@@ -0,0 +1,149 @@
+import os
+import numpy as np
+import chess
+import chess.polyglot
+from utils import board_to_planes
+
+# Feature plane tăng dần cho MCTS: plane của node con = plane của cha + thay đổi do nước đi,
+# thay vì board_to_tensor dựng lại 20 plane từ đầu ở mỗi lá. Cùng layout với board_to_tensor.
+# Lặp thế cờ đếm bằng lịch sử khóa Zobrist (reset ở nước không thể đảo ngược) thay vì board.is_repetition.
+# Bật CHESS_AI_CHECK_FEATURES=1 để so từng node với board_to_tensor (chậm, chỉ dùng khi debug).
+CHECK_ENV = "CHESS_AI_CHECK_FEATURES"
+CHECK = os.environ.get(CHECK_ENV, "") not in ("", "0")
+
+ZOBRIST = chess.polyglot.POLYGLOT_RANDOM_ARRAY
+HASHER = chess.polyglot.ZobristHasher(ZOBRIST)
+
+REP2, REP3 = 12, 13
+CASTLING = 14  # 14-17: trắng cánh hậu, trắng cánh vua, đen cánh hậu, đen cánh vua
+EP = 18
+TURN = 19
+
+
+def piece_channel(piece_type, color):
+    return piece_type - 1 + (0 if color == chess.WHITE else 6)
+
+
+def piece_key(piece_type, color, square):
+    # Cùng chỉ số với bảng Polyglot: (loại quân - 1) * 2 + (1 nếu trắng)
+    return ZOBRIST[64 * ((piece_type - 1) * 2 + (1 if color == chess.WHITE else 0)) + square]
+
+
+def castling_key(board):
+    return HASHER.hash_castling(board)
+
+
+def ep_key(board):
+    # Chỉ tính ô bắt tốt qua đường khi thật sự bắt được, giống khóa lặp thế cờ của python-chess
+    if board.ep_square is not None and board.has_legal_en_passant():
+        return ZOBRIST[772 + chess.square_file(board.ep_square)]
+    return 0
+
+
+def zobrist_key(board):
+    return HASHER.hash_board(board) ^ castling_key(board) ^ ep_key(board) ^ HASHER.hash_turn(board)
+
+
+class Features:
+    __slots__ = ("planes", "key", "castling", "ep", "history")
+
+    def __init__(self, planes, key, castling, ep, history):
+        self.planes = planes      # uint8 (20, 8, 8), các plane đều 0/1
+        self.key = key            # khóa Zobrist của thế cờ
+        self.castling = castling  # phần khóa của quyền nhập thành / bắt tốt qua đường, dùng lại khi tính con
+        self.ep = ep
+        self.history = history    # khóa các thế cờ từ sau nước không thể đảo ngược gần nhất, gồm thế hiện tại
+
+    def repetitions(self):
+        return self.history.count(self.key)
+
+
+def root_features(board):
+    planes = board_to_planes(board).astype(np.uint8)
+    key = zobrist_key(board)
+    keys = [key]
+    replay = board.copy()
+    while replay.move_stack:
+        move = replay.pop()
+        if replay.is_irreversible(move):
+            break
+        keys.append(zobrist_key(replay))
+    return Features(planes, key, castling_key(board), ep_key(board), tuple(reversed(keys)))
+
+
+def child_features(parent, parent_board, move, board):
+    # parent_board: thế cờ trước nước đi, board: thế cờ sau nước đi (đã push move)
+    planes = parent.planes.copy()
+    flat = planes.reshape(20, 64)
+    color = parent_board.turn
+    piece_type = parent_board.piece_type_at(move.from_square)
+    key = parent.key ^ ZOBRIST[780]  # đổi lượt
+
+    flat[piece_channel(piece_type, color), move.from_square] = 0
+    key ^= piece_key(piece_type, color, move.from_square)
+
+    if parent_board.is_en_passant(move):
+        captured_square = move.to_square - 8 if color == chess.WHITE else move.to_square + 8
+        flat[piece_channel(chess.PAWN, not color), captured_square] = 0
+        key ^= piece_key(chess.PAWN, not color, captured_square)
+    elif parent_board.is_castling(move):
+        rank = chess.square_rank(move.from_square)
+        if chess.square_file(move.to_square) > chess.square_file(move.from_square):
+            rook_from, rook_to = chess.square(7, rank), chess.square(5, rank)
+        else:
+            rook_from, rook_to = chess.square(0, rank), chess.square(3, rank)
+        rook = piece_channel(chess.ROOK, color)
+        flat[rook, rook_from] = 0
+        flat[rook, rook_to] = 1
+        key ^= piece_key(chess.ROOK, color, rook_from) ^ piece_key(chess.ROOK, color, rook_to)
+    else:
+        captured = parent_board.piece_type_at(move.to_square)
+        if captured is not None:
+            flat[piece_channel(captured, not color), move.to_square] = 0
+            key ^= piece_key(captured, not color, move.to_square)
+
+    placed = move.promotion or piece_type
+    flat[piece_channel(placed, color), move.to_square] = 1
+    key ^= piece_key(placed, color, move.to_square)
+
+    castling = parent.castling
+    if board.castling_rights != parent_board.castling_rights:
+        planes[CASTLING] = board.has_queenside_castling_rights(chess.WHITE)
+        planes[CASTLING + 1] = board.has_kingside_castling_rights(chess.WHITE)
+        planes[CASTLING + 2] = board.has_queenside_castling_rights(chess.BLACK)
+        planes[CASTLING + 3] = board.has_kingside_castling_rights(chess.BLACK)
+        castling = castling_key(board)
+        key ^= parent.castling ^ castling
+
+    if parent_board.ep_square is not None:
+        flat[EP, parent_board.ep_square] = 0
+    ep = 0
+    if board.ep_square is not None:
+        flat[EP, board.ep_square] = 1
+        ep = ep_key(board)
+    key ^= parent.ep ^ ep
+
+    planes[TURN] = 1 if board.turn == chess.WHITE else 0
+
+    if parent_board.is_irreversible(move):
+        history = (key,)
+    else:
+        history = parent.history + (key,)
+    repetitions = history.count(key)
+    planes[REP2] = repetitions >= 2
+    planes[REP3] = repetitions >= 3
+
+    features = Features(planes, key, castling, ep, history)
+    if CHECK:
+        check_features(features, board, move)
+    return features
+
+
+def check_features(features, board, move=None):
+    reference = board_to_planes(board)
+    if not np.array_equal(features.planes, reference):
+        channels = sorted(set(np.nonzero(features.planes != reference)[0].tolist()))
+        raise AssertionError(f"Feature plane lệch board_to_tensor ở channel {channels} "
+                             f"sau nước {move} tại {board.fen()}")
+    if features.key != zobrist_key(board):
+        raise AssertionError(f"Khóa Zobrist tăng dần lệch sau nước {move} tại {board.fen()}")
@@ -5,15 +5,11 @@ import pygame_menu
 import chess
 import chess.engine
 import threading
-import time
-import torch
 
 from pygame.locals import *
 from menu_screen import MenuScreen
 
-from mcts import MCTS
-from model import AlphaZeroNet
-from evalute_elo import model_get_best_move
+from probe import open_book, open_tablebase
 
 # Constants for initial menu screen
 MENU_WIDTH, MENU_HEIGHT = 540, 360
@@ -44,6 +40,28 @@ for piece, image_name in PIECE_IMAGE_MAP.items():
         print(f"Image not found: {image_path}")
         sys.exit()
 
+# Cache sprite đã scale theo kích thước ô, tránh scale lại mỗi ván / mỗi frame
+SCALED_PIECE_IMAGES = {}
+
+# FPS khi không có gì thay đổi, nhường CPU cho thread search
+IDLE_FPS = 10
+
+# Sách khai cuộc Polyglot / thư mục Syzygy cho AI (bỏ qua nếu không tồn tại)
+BOOK_PATH = "data/book.bin"
+SYZYGY_PATH = "data/syzygy"
+
+# torch / model chỉ được import khi chơi với máy; WARM_MODEL nạp trước ở thread nền khi menu đã hiện
+MODEL_PATH = "model.pt"
+WARM_MODEL = True
+
+def get_piece_images(size):
+    if size not in SCALED_PIECE_IMAGES:
+        SCALED_PIECE_IMAGES[size] = {
+            piece: pygame.transform.scale(image, (size, size)).convert_alpha()
+            for piece, image in PIECE_IMAGES.items()
+        }
+    return SCALED_PIECE_IMAGES[size]
+
 def display_game_over(winner=None):
     result_text = "Game Over"
     if winner:
@@ -69,11 +87,14 @@ class ChessGame:
         self.current_turn = chess.WHITE
         self.player_color = None
         self.model = None
+        self.mcts = None
+        self.ponder_thread = None
         self.max_time = 2
 
-        # Rescale piece images
-        for key in PIECE_IMAGES:
-            PIECE_IMAGES[key] = pygame.transform.scale(PIECE_IMAGES[key], (SQ_SIZE, SQ_SIZE))
+        self.piece_images = get_piece_images(SQ_SIZE)
+        # Trạng thái đã vẽ lên màn hình, dùng để tính các ô cần vẽ lại
+        self.drawn_pieces = None
+        self.drawn_drag_rect = None
 
     def draw_board(self):
         colors = [WHITE, BLACK]
@@ -97,15 +118,69 @@ class ChessGame:
                         continue
                     draw_x = board_col * SQ_SIZE
                     draw_y = board_row * SQ_SIZE
-                    screen.blit(PIECE_IMAGES[piece.symbol()], (draw_x, draw_y))
+                    screen.blit(self.piece_images[piece.symbol()], (draw_x, draw_y))
+
+    def square_rect(self, square):
+        row, col = 7 - chess.square_rank(square), chess.square_file(square)
+        if self.player_color == chess.BLACK:
+            row, col = 7 - row, 7 - col
+        return pygame.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+
+    def squares_under(self, rect):
+        squares = []
+        for row in range(max(rect.top // SQ_SIZE, 0), min((rect.bottom - 1) // SQ_SIZE, 7) + 1):
+            for col in range(max(rect.left // SQ_SIZE, 0), min((rect.right - 1) // SQ_SIZE, 7) + 1):
+                board_row, board_col = (7 - row, 7 - col) if self.player_color == chess.BLACK else (row, col)
+                squares.append(chess.square(board_col, 7 - board_row))
+        return squares
+
+    def draw_square(self, square):
+        rect = self.square_rect(square)
+        colors = [WHITE, BLACK]
+        pygame.draw.rect(screen, colors[(rect.x // SQ_SIZE + rect.y // SQ_SIZE) % 2], rect)
+        piece = self.board.piece_at(square)
+        if piece and not (self.dragging_piece and square == self.selected_square):
+            screen.blit(self.piece_images[piece.symbol()], rect)
+        return rect
+
+    def drag_rect(self):
+        if not self.dragging_piece:
+            return None
+        pos = pygame.mouse.get_pos()
+        return pygame.Rect(pos[0] - SQ_SIZE // 2, pos[1] - SQ_SIZE // 2, SQ_SIZE, SQ_SIZE)
 
-    def draw_dragging_piece(self):
+    def render(self):
+        # Chỉ vẽ lại các ô thay đổi và vùng quân đang kéo, trả về các rect cần update
+        pieces = self.board.piece_map()
         if self.dragging_piece:
-            pos = pygame.mouse.get_pos()
-            screen.blit(self.dragging_piece, (pos[0] - SQ_SIZE // 2, pos[1] - SQ_SIZE // 2))
+            pieces.pop(self.selected_square, None)
+        drag_rect = self.drag_rect()
+
+        if self.drawn_pieces is None:
+            self.draw_board()
+            self.draw_pieces()
+            dirty_rects = [screen.get_rect()]
+        else:
+            dirty = {sq for sq in chess.SQUARES if pieces.get(sq) != self.drawn_pieces.get(sq)}
+            if drag_rect != self.drawn_drag_rect:
+                for rect in (self.drawn_drag_rect, drag_rect):
+                    if rect is not None:
+                        dirty.update(self.squares_under(rect))
+            dirty_rects = [self.draw_square(sq) for sq in dirty]
+
+        if dirty_rects and drag_rect is not None:
+            screen.blit(self.dragging_piece, drag_rect)
+            dirty_rects.append(drag_rect)
+
+        self.drawn_pieces = pieces
+        self.drawn_drag_rect = drag_rect
+        return dirty_rects
 
     def handle_events(self):
         if self.model is None or self.board.turn == self.player_color:
+            if self.mcts is not None and self.ponder_thread is None:
+                # Suy nghĩ trước trong thời gian của người chơi
+                self.ponder_thread = self.mcts.ponder(self.board)
             for event in pygame.event.get():
                 if event.type == QUIT:
                     pygame.quit()
@@ -119,11 +194,17 @@ class ChessGame:
                 self.ai_thread = threading.Thread(target=self.run_engine_move)
                 self.ai_thread.start()
 
+    def stop_pondering(self):
+        if self.ponder_thread is not None:
+            self.mcts.stop()
+            self.ponder_thread.join()
+            self.ponder_thread = None
+
     def run_engine_move(self):
         try:
             print("[AI] Thinking...")
-            best_move = model_get_best_move(self.board)
-            time.sleep(0.5)
+            # Cây từ lúc ponder được tái sử dụng nếu nước người chơi đã được khám phá
+            best_move = self.mcts.search(self.board)
             self.board.push(best_move)
             self.current_turn = not self.current_turn
             print("[AI] Move done.")
@@ -139,7 +220,7 @@ class ChessGame:
         if piece and piece.color == self.current_turn:
             self.selected_square = square
             self.start_pos = (row, col)
-            self.dragging_piece = PIECE_IMAGES[piece.symbol()]
+            self.dragging_piece = self.piece_images[piece.symbol()]
 
     def handle_mouse_up(self, event):
         if not self.dragging_piece:
@@ -154,6 +235,7 @@ class ChessGame:
                 move = legal_move
                 break
         if move:
+            self.stop_pondering()
             self.board.push(move)
             self.current_turn = not self.current_turn
         self.selected_square = None
@@ -163,11 +245,11 @@ class ChessGame:
         clock = pygame.time.Clock()
         while not self.board.is_game_over():
             self.handle_events()
-            self.draw_board()
-            self.draw_pieces()
-            self.draw_dragging_piece()
-            pygame.display.flip()
-            clock.tick(60)
+            dirty_rects = self.render()
+            if dirty_rects:
+                pygame.display.update(dirty_rects)
+            clock.tick(60 if dirty_rects or self.dragging_piece else IDLE_FPS)
+        self.stop_pondering()
         result = self.board.result()
         winner = "Draw" if result == "1/2-1/2" else ("White" if result == "1-0" else "Black")
         display_game_over(winner)
@@ -178,15 +260,26 @@ def start_pvp():
     ChessGame().run()
 
 def start_pvc():
+    from mcts import MCTS
+    from model_registry import load_model
+
     game = ChessGame()
     game.player_color = chess.WHITE
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model = AlphaZeroNet().to(device)
-    model.load_state_dict(torch.load("model.pt", map_location=device))
+    model = load_model(MODEL_PATH, required=True)
     game.model = model
+    game.mcts = MCTS(model, time_limit=game.max_time,
+                     book=open_book(BOOK_PATH), tablebase=open_tablebase(SYZYGY_PATH))
     game.run()
 
+def warm_model():
+    def run():
+        from model_registry import load_model
+        if os.path.exists(MODEL_PATH):
+            load_model(MODEL_PATH)
+
+    threading.Thread(target=run, daemon=True).start()
+
 if __name__ == '__main__':
     screen = pygame.display.set_mode((540, 360))
-    menu = MenuScreen(screen, start_pvp, start_pvc)
+    menu = MenuScreen(screen, start_pvp, start_pvc, on_ready=warm_model if WARM_MODEL else None)
     menu.main_loop()
\ No newline at end of file
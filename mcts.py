@@ -1,28 +1,81 @@
 import numpy as np
 import chess
 import time
+import threading
 from utils import move_to_index
+from time_manager import TimeManager
+from batch_evaluator import BatchEvaluator
+from profiler import profiler
+from features import root_features, child_features
+
+NOT_CHECKED = object()
 
 class MCTSNode:
-    def __init__(self, board, parent=None, prior=0.0):
-        self.board = board
+    def __init__(self, board, parent=None, prior=0.0, move=None):
+        # Node con tạo board (và feature plane) khi được dùng lần đầu, không copy board cho mọi nước hợp lệ
+        self._board = board
+        self.move = move
+        self._features = None
         self.parent = parent
         self.children = {}
         self.visit_count = 0
         self.total_value = 0.0
         self.prior = prior
+        # Search song song: virtual loss của các thread đang đi qua node, event khi node đang chờ NN
+        self.virtual_loss = 0
+        self.pending = None
+        self._terminal = NOT_CHECKED
+        self.noised = False  # đã thêm nhiễu Dirichlet vào prior của con (khi làm root trong self-play)
+
+    @property
+    def board(self):
+        if self._board is None:
+            board = self.parent.board.copy()
+            board.push(self.move)
+            self._board = board
+        return self._board
+
+    def features(self):
+        # Plane đầu vào NN: tính tăng dần từ node cha, root (hoặc node mất cha khi tái sử dụng cây) tính từ đầu
+        if self._features is None:
+            if self.parent is None:
+                self._features = root_features(self.board)
+            else:
+                self._features = child_features(self.parent.features(), self.parent.board, self.move, self.board)
+        return self._features
 
     def is_expanded(self):
         return len(self.children) > 0
 
+    def terminal_value(self):
+        # Kết quả ván theo góc nhìn bên tới lượt (None nếu chưa kết thúc), chỉ gọi board.outcome() một lần
+        if self._terminal is NOT_CHECKED:
+            outcome = self.board.outcome()
+            if outcome is None:
+                self._terminal = None
+            elif outcome.winner is None:
+                self._terminal = 0
+            else:
+                self._terminal = 1 if outcome.winner == self.board.turn else -1
+        return self._terminal
+
+    def is_terminal(self):
+        return self.terminal_value() is not None
+
+    def set_terminal(self, value):
+        # Giá trị chính xác từ nguồn ngoài (tablebase): node được coi như lá kết thúc
+        self._terminal = value
+
     def select_child(self, c_puct=1.0):  # Đơn giản hóa c_puct = 1.0
         best_score = -np.inf
         best_move = None
         best_child = None
         
+        explore = c_puct * np.sqrt(self.visit_count + self.virtual_loss)
         for move, child in self.children.items():
-            q_value = child.total_value / child.visit_count if child.visit_count > 0 else 0
-            u_value = c_puct * child.prior * np.sqrt(self.visit_count) / (1 + child.visit_count)
+            visits = child.visit_count + child.virtual_loss
+            q_value = (child.total_value - child.virtual_loss) / visits if visits > 0 else 0
+            u_value = explore * child.prior / (1 + visits)
             score = q_value + u_value
 
             if score > best_score:
@@ -44,70 +97,375 @@ class MCTSNode:
         if total_prob < 1e-8:
             uniform_prob = 1.0 / len(legal_moves)
             for move in legal_moves:
-                next_board = self.board.copy()
-                next_board.push(move)
-                self.children[move] = MCTSNode(next_board, parent=self, prior=uniform_prob)
+                self.children[move] = MCTSNode(None, parent=self, prior=uniform_prob, move=move)
         else:
-            for move in legal_moves:
-                idx = move_to_index(move)
-                prob = policy_copy[idx] / total_prob
-                next_board = self.board.copy()
-                next_board.push(move)
-                self.children[move] = MCTSNode(next_board, parent=self, prior=prob)
+            for move, prob in zip(legal_moves, move_probs):
+                self.children[move] = MCTSNode(None, parent=self, prior=prob / total_prob, move=move)
 
     def backpropagate(self, value):
-        self.visit_count += 1
-        self.total_value += value
-        if self.parent:
-            self.parent.backpropagate(-value)
+        # value theo góc nhìn bên vừa đi nước dẫn tới node này; đi ngược lên root đúng một lần
+        node = self
+        while node is not None:
+            node.visit_count += 1
+            node.total_value += value
+            value = -value
+            node = node.parent
 
 
 class MCTS:
-    def __init__(self, model, time_limit, c_puct=1.0):
+    def __init__(self, model, time_limit, c_puct=1.0, max_nodes=None, time_manager=None, num_threads=1, batch_size=8,
+                 book=None, tablebase=None, dirichlet_alpha=0.3, dirichlet_epsilon=0.0, temperature=0.0, seed=None):
         self.model = model
         self.time_limit = time_limit
         self.root = None
         self.c_puct = c_puct
+        self.max_nodes = max_nodes  # Giới hạn số node tạo ra mỗi lần search (option Hash của UCI)
+        self.stop_event = threading.Event()
+        self.time_manager = time_manager or TimeManager()
 
-    def search(self, board):
-        self.root = MCTSNode(board)
-        policy, _ = self.model.predict(board)
+        # Tree-parallel: num_threads thread dùng chung một cây, NN được gom batch qua BatchEvaluator
+        self.num_threads = num_threads
+        self.batch_size = batch_size
+        self.tree_lock = threading.Lock()
+        self.collisions = 0
+        self.search_error = None
 
-        self.root.expand(policy)
+        # Sách khai cuộc / tablebase (probe.py), None nếu không dùng
+        self.book = book
+        self.tablebase = tablebase
+        self.skipped_searches = 0
 
-        start_time = time.time()
-        simulations = 0
+        # Self-play: nhiễu Dirichlet ở root (epsilon = 0 là tắt) và chọn nước theo visit^(1/temperature)
+        # (temperature = 0: nước nhiều visit nhất)
+        self.dirichlet_alpha = dirichlet_alpha
+        self.dirichlet_epsilon = dirichlet_epsilon
+        self.temperature = temperature
+        self.rng = np.random.default_rng(seed)
 
-        while time.time() - start_time < self.time_limit:
-            node = self.root
-            path = [node]
+        # Thống kê của lần search gần nhất, dùng cho info của UCI
+        self.info_callback = None
+        self.info_interval = 1.0
+        self.simulations = 0
+        self.nodes = 0
+        self.max_depth = 0
+        self.total_depth = 0
+        self.search_start = 0.0
 
-            # Selection
-            while node.is_expanded() and not node.board.is_game_over():
-                move, node = node.select_child(c_puct=self.c_puct)
-                path.append(node)
+    def stop(self):
+        # Dừng search/ponder đang chạy ở thread khác
+        self.stop_event.set()
 
-            # Evaluation
-            if not node.board.is_game_over():
-                policy, value = self.model.predict(node.board)
-                node.expand(policy)
-            else:
-                result = node.board.result()
-                if result == "1-0":
-                    value = 1
-                elif result == "0-1":
-                    value = -1
+    def _reuse_root(self, board):
+        # Tái sử dụng cây con nếu board nối tiếp từ root cũ (nước đã đi / nước đối thủ)
+        if self.root is None:
+            return None
+        old_stack = self.root.board.move_stack
+        new_stack = board.move_stack
+        if len(new_stack) < len(old_stack) or new_stack[:len(old_stack)] != old_stack:
+            return None
+        node = self.root
+        for move in new_stack[len(old_stack):]:
+            node = node.children.get(move)
+            if node is None:
+                return None
+        if node.board.fen() != board.fen():
+            return None
+        if not node.is_expanded():
+            # Lá chưa expand không có gì để giữ; lá được tablebase đánh dấu kết thúc (set_terminal) còn làm
+            # _select dừng ngay ở root, con không bao giờ được visit: dựng root mới
+            return None
+        node.parent = None
+        return node
+
+    def search(self, board, time_limit=None, max_simulations=None, remaining=None, increment=0.0, moves_to_go=None):
+        # remaining/increment (giây): chia thời gian theo đồng hồ ván đấu thay vì time_limit cố định
+        if time_limit is None and remaining is None:
+            time_limit = self.time_limit
+        self.stop_event.clear()
+        self.time_manager.start(board, time_limit, remaining, increment, moves_to_go)
+        return self._search(board, max_simulations)
+
+    def search_async(self, board, time_limit=None, max_simulations=None, remaining=None, increment=0.0,
+                     moves_to_go=None, on_done=None):
+        # Search ở thread nền; không có time_limit/remaining thì chạy tới khi stop() hoặc hết max_simulations
+        self.stop_event.clear()
+        self.time_manager.start(board, time_limit, remaining, increment, moves_to_go)
+
+        def run():
+            best_move = self._search(board, max_simulations)
+            if on_done is not None:
+                on_done(best_move)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def ponder(self, board):
+        # Search không giới hạn thời gian trong lúc người chơi suy nghĩ, dừng bằng stop()
+        return self.search_async(board.copy())
+
+    def _should_stop(self, max_simulations):
+        if self.stop_event.is_set():
+            return True
+        if self.time_manager.should_stop(self.root, self.simulations):
+            return True
+        if max_simulations is not None and self.simulations >= max_simulations:
+            return True
+        return self.max_nodes is not None and self.nodes >= self.max_nodes
+
+    def _search(self, board, max_simulations=None):
+        self.search_start = time.time()
+        self.simulations = 0
+        self.nodes = 0
+        self.max_depth = 0
+        self.total_depth = 0
+        self.collisions = 0
+        self.last_info = self.search_start
+        # Search trên bản copy: board của người gọi (vd board GUI) có thể đang được thread khác đọc
+        board = board.copy()
+
+        # Có nước trong sách / tablebase thì trả ngay, không search (root = None: không có policy từ search)
+        probed_move = self._probe_root(board)
+        if probed_move is not None:
+            self.root = None
+            self.skipped_searches += 1
+            profiler.count("mcts.skipped_searches")
+            return probed_move
+
+        self.root = self._reuse_root(board) or MCTSNode(board)
+        if not self.root.is_expanded():
+            policy, _ = self.model.predict_planes(self.root.features().planes)
+            with profiler.span("mcts.expand"):
+                self.root.expand(policy)
+        if not self.root.is_expanded():
+            return None
+        if self.dirichlet_epsilon > 0:
+            self._add_root_noise()
+
+        if self.num_threads > 1:
+            self._search_parallel(max_simulations)
+        else:
+            while not self._should_stop(max_simulations):
+                with profiler.span("mcts.select"):
+                    path = self._select()
+                node = path[-1]
+                with profiler.span("mcts.terminal_check"):
+                    value = self._leaf_value(node)
+                if value is None:
+                    with profiler.span("mcts.features"):
+                        planes = node.features().planes
+                    policy, value = self.model.predict_planes(planes)
+                    with profiler.span("mcts.expand"):
+                        self._expand(node, policy)
+                with profiler.span("mcts.backprop"):
+                    self._backup(path, value)
+                profiler.tick()
+
+        profiler.count("mcts.searches")
+        profiler.count("mcts.simulations", self.simulations)
+        profiler.count("mcts.nodes", self.nodes)
+        profiler.count("mcts.collisions", self.collisions)
+
+        if self.info_callback is not None:
+            self.info_callback(self)
+
+        return self.choose_move(self.temperature)
+
+    def choose_move(self, temperature=0.0):
+        # temperature = 0: nước nhiều visit nhất; > 0: lấy mẫu theo visit^(1/temperature)
+        moves = list(self.root.children)
+        visits = np.array([child.visit_count for child in self.root.children.values()], dtype=np.float64)
+        if temperature <= 0 or visits.sum() == 0:
+            return moves[int(np.argmax(visits))]
+        probs = (visits / visits.max()) ** (1.0 / temperature)
+        probs /= probs.sum()
+        return moves[self.rng.choice(len(moves), p=probs)]
+
+    def _add_root_noise(self):
+        # Mỗi root chỉ thêm nhiễu một lần, kể cả khi được tái sử dụng cho lần search sau
+        if self.root.noised:
+            return
+        children = list(self.root.children.values())
+        noise = self.rng.dirichlet([self.dirichlet_alpha] * len(children))
+        for child, eta in zip(children, noise):
+            child.prior = (1 - self.dirichlet_epsilon) * child.prior + self.dirichlet_epsilon * eta
+        self.root.noised = True
+
+    def _search_parallel(self, max_simulations):
+        self.search_error = None
+        evaluator = BatchEvaluator(self.model, batch_size=self.batch_size)
+        workers = [threading.Thread(target=self._worker, args=(evaluator, max_simulations), daemon=True)
+                   for _ in range(self.num_threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        evaluator.close()
+        if self.search_error is not None:
+            raise self.search_error
+
+    def _worker(self, evaluator, max_simulations):
+        while True:
+            with self.tree_lock, profiler.span("mcts.select"):
+                if self.search_error is not None or self._should_stop(max_simulations):
+                    return
+                path = self._select()
+                node = path[-1]
+                pending = node.pending
+                if pending is None:
+                    value = self._leaf_value(node)
+                    for n in path:
+                        n.virtual_loss += 1
+                    if value is None:
+                        node.pending = threading.Event()
                 else:
-                    value = 0
+                    self.collisions += 1  # đếm trong tree_lock, counter dùng chung giữa các thread
+
+            if pending is not None:
+                # Thread khác đang chờ NN cho lá này: đợi xong rồi chọn lại
+                with profiler.span("mcts.collision_wait"):
+                    pending.wait()
+                continue
+
+            if value is None:
+                with profiler.span("mcts.features"):
+                    planes = node.features().planes
+                try:
+                    policy, value = evaluator.evaluate(planes)
+                except Exception as error:
+                    # Gỡ lá đang chờ để thread khác không đợi mãi, dừng mọi thread và báo lỗi từ _search_parallel
+                    with self.tree_lock:
+                        node.pending.set()
+                        node.pending = None
+                        for n in path:
+                            n.virtual_loss -= 1
+                        if self.search_error is None:
+                            self.search_error = error
+                    return
+
+            with self.tree_lock, profiler.span("mcts.backprop"):
+                if node.pending is not None:
+                    self._expand(node, policy)
+                    node.pending.set()
+                    node.pending = None
+                for n in path:
+                    n.virtual_loss -= 1
+                self._backup(path, value)
+            profiler.tick()
+
+    def _select(self):
+        node = self.root
+        path = [node]
+        while node.is_expanded() and not node.is_terminal():
+            move, node = node.select_child(c_puct=self.c_puct)
+            path.append(node)
+        return path
+
+    def _probe_root(self, board):
+        if self.book is not None:
+            move = self.book.move(board)
+            if move is not None:
+                return move
+        if self.tablebase is not None:
+            return self.tablebase.best_move(board)
+        return None
+
+    def _leaf_value(self, node):
+        value = node.terminal_value()
+        if value is None and self.tablebase is not None and node is not self.root:
+            value = self.tablebase.value(node.board)
+            if value is not None:
+                node.set_terminal(value)
+                profiler.count("mcts.tablebase_leaves")
+        return value
+
+    def _expand(self, node, policy):
+        node.expand(policy)
+        self.nodes += len(node.children)
+
+    def _backup(self, path, value):
+        # value (NN hoặc kết quả ván) theo góc nhìn bên tới lượt ở lá, lá lưu theo góc nhìn bên vừa đi
+        path[-1].backpropagate(-value)
+
+        self.simulations += 1
+        self.total_depth += len(path) - 1
+        self.max_depth = max(self.max_depth, len(path) - 1)
+
+        if self.info_callback is not None and time.time() - self.last_info >= self.info_interval:
+            self.last_info = time.time()
+            self.info_callback(self)
+
+    def root_value(self):
+        # Q của nước nhiều visit nhất, theo góc nhìn bên tới lượt ở root; None nếu không search (sách / tablebase)
+        if self.root is None or not self.root.is_expanded():
+            return None
+        best = max(self.root.children.values(), key=lambda child: child.visit_count)
+        if best.visit_count == 0:
+            return None
+        return best.total_value / best.visit_count
+
+    def principal_variation(self, max_length=10):
+        pv = []
+        node = self.root
+        while node is not None and node.is_expanded() and len(pv) < max_length:
+            move, node = max(node.children.items(), key=lambda x: x[1].visit_count)
+            if node.visit_count == 0:
+                break
+            pv.append(move)
+        return pv
+
+
+def check_tree(root):
+    # Bất biến sau search: mỗi simulation cộng đúng một visit cho mỗi node trên đường đi.
+    # Node đã expand có visit = tổng visit của con (+1 cho lần được đánh giá khi còn là lá, trừ root mới).
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node.is_expanded():
+            child_visits = sum(child.visit_count for child in node.children.values())
+            if node.visit_count - child_visits not in (0, 1):
+                raise AssertionError(f"visit count {node.visit_count} != children {child_visits} (+1) "
+                                     f"at {node.board.fen()}")
+            stack.extend(node.children.values())
+        if abs(node.total_value) > node.visit_count + 1e-6:
+            raise AssertionError(f"|total_value| > visit_count at {node.board.fen()}")
+        if node.virtual_loss != 0:
+            raise AssertionError(f"virtual loss left on {node.board.fen()}")
+
+
+def thread_scaling(model, board, time_limit=2.0, max_threads=4, batch_size=8):
+    # nps của search với 1..max_threads thread trên cùng một thế cờ
+    results = {}
+    for num_threads in range(1, max_threads + 1):
+        mcts = MCTS(model, time_limit=time_limit, num_threads=num_threads, batch_size=batch_size)
+        # Search không giới hạn rồi dừng sau time_limit để không bị dừng sớm
+        thread = mcts.search_async(board.copy())
+        time.sleep(time_limit)
+        mcts.stop()
+        thread.join()
+        elapsed = time.time() - mcts.search_start
+        results[num_threads] = mcts.simulations / elapsed
+    return results
+
 
-            # Backpropagation
-            for node in reversed(path):
-                node.backpropagate(value)
-                value = -value
+if __name__ == "__main__":
+    import argparse
+    import os
+    import torch
+    from model import AlphaZeroNet, get_device
 
-            simulations += 1
+    parser = argparse.ArgumentParser(description="Đo nps của tree-parallel MCTS theo số thread")
+    parser.add_argument("--model", default="model.pt")
+    parser.add_argument("--blocks", type=int, default=19)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--time", type=float, default=5.0)
+    args = parser.parse_args()
 
-        # Chọn nước đi nhiều visit nhất
-        best_move = max(self.root.children.items(), key=lambda x: x[1].visit_count)[0]
+    net = AlphaZeroNet(n_res_blocks=args.blocks).to(get_device())
+    if os.path.exists(args.model):
+        net.load_state_dict(torch.load(args.model, map_location=get_device()))
 
-        return best_move
\ No newline at end of file
+    scaling = thread_scaling(net, chess.Board(), args.time, args.threads, args.batch_size)
+    for num_threads, nps in scaling.items():
+        print(f"threads={num_threads:3d}  nps={nps:8.1f}  speedup={nps / scaling[1]:.2f}x")
@@ -8,10 +8,11 @@ import pygame_menu
 MENU_WIDTH, MENU_HEIGHT = 540, 360
 
 class MenuScreen:
-    def __init__(self, screen, start_pvp, start_pvc):
+    def __init__(self, screen, start_pvp, start_pvc, on_ready=None):
         self.screen = screen
         self.start_pvp = start_pvp
         self.start_pvc = start_pvc
+        self.on_ready = on_ready  # gọi một lần sau frame menu đầu tiên (vd nạp model ở nền)
 
         # Load background
         self.bg = pygame.transform.scale(pygame.image.load("./data/images/bg.png"), (MENU_WIDTH, MENU_HEIGHT))
@@ -46,3 +47,6 @@ class MenuScreen:
             self.screen.blit(self.bg, (0, 0))
             self.menu.draw(self.screen)
             pygame.display.update()
+            if self.on_ready is not None:
+                on_ready, self.on_ready = self.on_ready, None
+                on_ready()
@@ -2,9 +2,25 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from utils import board_to_tensor
+from profiler import profiler
+
+_device = None
+
+
+def get_device():
+    # Dò CUDA lần đầu khi cần, không phải lúc import (menu GUI, worker spawn không phải chờ)
+    global _device
+    if _device is None:
+        _device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    return _device
+
+
+def __getattr__(name):
+    # Giữ tương thích với `from model import device`
+    if name == "device":
+        return get_device()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f"Using device: {device}")
 
 class ResidualBlock(nn.Module):
     def __init__(self, channels):
@@ -60,10 +76,33 @@ class AlphaZeroNet(nn.Module):
         return policy, value
     
     def predict(self, board):
+        with profiler.span("nn.encode"):
+            planes = board_to_tensor(board)
+        return self.predict_planes(planes)
+
+    def predict_planes(self, planes):
+        # planes: (20, 8, 8) từ board_to_tensor hoặc features.py (numpy uint8/float hoặc tensor)
         self.eval()
         with torch.no_grad():
-            x = board_to_tensor(board).unsqueeze(0).to(device)  # shape: (1, 20, 8, 8)
-            policy_logits, value = self.forward(x)
-            policy = F.softmax(policy_logits, dim=1)
-            policy = policy.squeeze(0).cpu().numpy()
+            x = torch.as_tensor(planes).float().unsqueeze(0).to(get_device())  # shape: (1, 20, 8, 8)
+            with profiler.span("nn.forward"):
+                policy_logits, value = self.forward(x)
+                policy = F.softmax(policy_logits, dim=1)
+                policy = policy.squeeze(0).cpu().numpy()
+            profiler.count("nn.positions")
             return policy, value.item()
+
+    def predict_batch(self, boards):
+        with profiler.span("nn.encode"):
+            planes = [board_to_tensor(board) for board in boards]
+        return self.predict_planes_batch(planes)
+
+    def predict_planes_batch(self, planes_list):
+        self.eval()
+        with torch.no_grad():
+            x = torch.stack([torch.as_tensor(planes) for planes in planes_list]).float().to(get_device())
+            with profiler.span("nn.forward"):
+                policy_logits, values = self.forward(x)
+                policies = F.softmax(policy_logits, dim=1).cpu().numpy()
+            profiler.count("nn.positions", len(planes_list))
+            return policies, values.view(-1).cpu().tolist()
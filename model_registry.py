@@ -0,0 +1,48 @@
+import os
+import threading
+import torch
+from model import AlphaZeroNet, get_device
+
+# Tạo và nạp model khi cần lần đầu, dùng chung một bản cho cùng file checkpoint.
+# Model trong cache chỉ dùng để suy luận (eval); training nên tự tạo model riêng.
+MODELS = {
+    "default": ("model.pt", 19),
+    "stockfish": ("model_4.pt", 19),  # model train bằng dữ liệu Stockfish (evalute_elo)
+}
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def register(name, path, n_res_blocks=19):
+    MODELS[name] = (path, n_res_blocks)
+
+
+def load_model(path="model.pt", n_res_blocks=19, required=False):
+    # Nạp lại khi file checkpoint đổi (mtime); thiếu file thì trả model khởi tạo ngẫu nhiên trừ khi required
+    exists = os.path.exists(path)
+    if required and not exists:
+        raise FileNotFoundError(f"Không tìm thấy model '{path}'")
+    key = (os.path.abspath(path), n_res_blocks)
+    mtime = os.path.getmtime(path) if exists else None
+    with _lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        device = get_device()
+        model = AlphaZeroNet(n_res_blocks=n_res_blocks).to(device)
+        if exists:
+            model.load_state_dict(torch.load(path, map_location=device))
+        model.eval()
+        _cache[key] = (mtime, model)
+        return model
+
+
+def get_model(name="default", required=False):
+    path, n_res_blocks = MODELS[name]
+    return load_model(path, n_res_blocks, required)
+
+
+def clear():
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,162 @@
+import io
+import os
+import re
+import bz2
+import chess.pgn
+
+try:
+    import zstandard
+except ImportError:  # chỉ cần khi đọc .pgn.zst
+    zstandard = None
+
+# Đọc PGN (kể cả .pgn.zst / .pgn.bz2 của Lichess) theo dòng, giải nén dần, không cần file .pgn trên đĩa.
+# Tách theo ranh giới ván, lọc theo header (Elo, thời gian, kết quả) trước khi parse nước đi.
+# Nhiều worker chia nhau một file qua read_games: một process đọc / giải nén file đúng một lần và đưa
+# từng ván vào queue, các worker lấy ván từ queue (queued_games).
+
+HEADER_RE = re.compile(r'^\[(\w+)\s+"(.*)"\]\s*$')
+
+
+def open_pgn(path):
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError(f"Cần cài 'zstandard' để đọc {path} (pip install zstandard)")
+        raw = open(path, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return io.TextIOWrapper(reader, encoding="utf-8", errors="replace")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def iter_game_texts(stream):
+    # Mỗi ván = các dòng header + movetext; ván mới bắt đầu ở dòng header đầu tiên sau movetext
+    lines = []
+    in_moves = False
+    for line in stream:
+        if line.startswith("["):
+            if in_moves:
+                yield "".join(lines)
+                lines = []
+                in_moves = False
+        elif line.strip():
+            in_moves = True
+        if lines or line.strip():
+            lines.append(line)
+    if lines:
+        yield "".join(lines)
+
+
+def parse_headers(text):
+    headers = {}
+    for line in text.splitlines():
+        if not line.startswith("["):
+            if line.strip():
+                break
+            continue
+        match = HEADER_RE.match(line)
+        if match:
+            headers[match.group(1)] = match.group(2)
+    return headers
+
+
+def estimated_seconds(time_control):
+    # Thời lượng ước tính kiểu Lichess: base + 40 * increment; None nếu không có đồng hồ ("-")
+    try:
+        base, increment = time_control.split("+")
+        return int(base) + 40 * int(increment)
+    except ValueError:
+        return None
+
+
+class HeaderFilter:
+    def __init__(self, min_elo=None, max_elo=None, min_seconds=None, max_seconds=None, time_controls=None,
+                 results=None, rated_only=False):
+        self.min_elo = min_elo
+        self.max_elo = max_elo
+        self.min_seconds = min_seconds  # theo estimated_seconds(TimeControl)
+        self.max_seconds = max_seconds
+        self.time_controls = set(time_controls) if time_controls else None  # vd {"300+0", "180+2"}
+        self.results = set(results) if results else None  # vd {"1-0", "0-1", "1/2-1/2"}
+        self.rated_only = rated_only
+        self.accepted = 0
+        self.rejected = 0
+
+    def accept(self, headers):
+        ok = self._check(headers)
+        if ok:
+            self.accepted += 1
+        else:
+            self.rejected += 1
+        return ok
+
+    def _check(self, headers):
+        if self.results is not None and headers.get("Result") not in self.results:
+            return False
+        if self.rated_only and "Rated" not in headers.get("Event", ""):
+            return False
+        if self.min_elo is not None or self.max_elo is not None:
+            for key in ("WhiteElo", "BlackElo"):
+                try:
+                    elo = int(headers.get(key, ""))
+                except ValueError:
+                    return False
+                if self.min_elo is not None and elo < self.min_elo:
+                    return False
+                if self.max_elo is not None and elo > self.max_elo:
+                    return False
+        time_control = headers.get("TimeControl", "-")
+        if self.time_controls is not None and time_control not in self.time_controls:
+            return False
+        if self.min_seconds is not None or self.max_seconds is not None:
+            seconds = estimated_seconds(time_control)
+            if seconds is None:
+                return False
+            if self.min_seconds is not None and seconds < self.min_seconds:
+                return False
+            if self.max_seconds is not None and seconds > self.max_seconds:
+                return False
+        return True
+
+
+def stream_games(path, header_filter=None, start_index=0):
+    # Sinh (game_index, chess.pgn.Game); game_index là vị trí của ván trong file
+    with open_pgn(path) as stream:
+        for game_index, text in enumerate(iter_game_texts(stream)):
+            if game_index < start_index:
+                continue
+            if header_filter is not None and not header_filter.accept(parse_headers(text)):
+                continue
+            game = chess.pgn.read_game(io.StringIO(text))
+            if game is not None:
+                yield game_index, game
+
+
+def read_games(path, game_queue, num_workers, header_filter=None, start_index=0):
+    # Chạy trong process đọc: đưa (game_index, text) đã qua lọc header vào game_queue (nên có maxsize để
+    # không đọc vượt xa worker), cuối cùng gửi None cho mỗi worker
+    try:
+        with open_pgn(path) as stream:
+            for game_index, text in enumerate(iter_game_texts(stream)):
+                if game_index < start_index:
+                    continue
+                if header_filter is not None and not header_filter.accept(parse_headers(text)):
+                    continue
+                game_queue.put((game_index, text))
+    finally:
+        for _ in range(num_workers):
+            game_queue.put(None)
+    if header_filter is not None:
+        print(f"[{os.path.basename(path)}] Lọc header: nhận {header_filter.accepted}, bỏ {header_filter.rejected}")
+
+
+def queued_games(game_queue):
+    # Phía worker của read_games: sinh (game_index, chess.pgn.Game) tới khi nhận None
+    while True:
+        item = game_queue.get()
+        if item is None:
+            return
+        game_index, text = item
+        game = chess.pgn.read_game(io.StringIO(text))
+        if game is not None:
+            yield game_index, game
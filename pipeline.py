@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import queue
+import chess
+import torch
+
+from model import AlphaZeroNet, get_device
+from self_play import SelfPlay
+from training import AlphaZeroTrainer, BOOK_PATH, SYZYGY_PATH, sample_to_device, make_adjudicator, worker_context
+from replay_buffer import ReplayStore, ReplaySampler
+from shared_weights import SharedWeights
+from checkpoint import CheckpointManager
+from probe import open_book, open_tablebase
+from profiler import profiler
+
+# Actor/learner bất đồng bộ: self-play chạy liên tục, learner train song song trên cửa sổ dữ liệu mới nhất.
+NUM_ACTORS = 4
+SELF_PLAY_TIME = 1.0
+WINDOW_SIZE = 20000          # số sample mới nhất learner lấy mẫu (chia đều cho các actor)
+RECENCY_HALF_LIFE = 2500     # mỗi store: sample cũ hơn chừng này sample có xác suất được chọn giảm một nửa
+MIN_SAMPLES = 2000           # chờ đủ dữ liệu trước khi bắt đầu train
+TARGET_REUSE = 4.0           # số sample đã train / số sample sinh ra; learner chờ khi vượt quá
+BATCH_SIZE = 64
+PUBLISH_EVERY = 200          # số bước train giữa hai lần phát trọng số cho actor
+TOTAL_STEPS = 100000
+DASHBOARD_INTERVAL = 30.0    # giây
+METRICS_PATH = "pipeline_metrics.jsonl"
+CHECKPOINT_DIR = "checkpoints_pipeline"
+ADJUDICATION_REPORT = 50     # số ván giữa hai lần actor in thống kê xử sớm
+
+
+def actor_store_dir(actor_id):
+    return f"replay_store_actors_{actor_id}"
+
+
+def run_actor(actor_id, shared_weights, sample_queue, stop_event):
+    # Actor ghi sample thẳng vào store memmap của mình, queue chỉ báo số sample mới
+    try:
+        model = AlphaZeroNet().to(get_device())
+        version = shared_weights.pull(model)
+        model.eval()
+        book = open_book(BOOK_PATH)
+        tablebase = open_tablebase(SYZYGY_PATH)
+        store = ReplayStore(actor_store_dir(actor_id))
+        adjudicator = make_adjudicator(tablebase)
+        games = 0
+
+        while not stop_event.is_set():
+            with profiler.span("actor.load_model"):
+                version = shared_weights.pull(model, version)
+            sp = SelfPlay(model, time_limit=SELF_PLAY_TIME, board=chess.Board(), book=book, tablebase=tablebase,
+                          adjudicator=adjudicator)
+            with profiler.span("actor.game"):
+                game_data, result = sp.play_game()
+            games += 1
+            if adjudicator is not None and games % ADJUDICATION_REPORT == 0:
+                print(f"[Actor {actor_id}] Adjudication: {adjudicator.summary()}")
+            if not game_data:
+                continue
+            with profiler.span("actor.save_samples"):
+                store.append(game_data, version)
+            sample_queue.put((actor_id, version, len(game_data)))
+    finally:
+        profiler.finish()
+
+
+class Dashboard:
+    def __init__(self, path=METRICS_PATH, interval=DASHBOARD_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.start = time.time()
+        self.last_report = self.start
+        self.last = {"games": 0, "generated": 0, "trained": 0}
+        self.games = 0
+        self.generated = 0
+        self.trained = 0
+        self.steps = 0
+        self.loss = 0.0
+        self.staleness = 0.0
+
+    def record_game(self, num_samples):
+        self.games += 1
+        self.generated += num_samples
+
+    def record_batch(self, batch_size, loss, staleness):
+        self.steps += 1
+        self.trained += batch_size
+        self.loss = loss
+        self.staleness = staleness
+
+    def maybe_report(self, version, window_size, force=False):
+        now = time.time()
+        if now - self.last_report < self.interval and not force:
+            return
+        elapsed = max(now - self.last_report, 1e-6)
+        metrics = {
+            "time": round(now - self.start, 1),
+            "version": version,
+            "games": self.games,
+            "generated": self.generated,
+            "trained": self.trained,
+            "steps": self.steps,
+            "games_per_min": (self.games - self.last["games"]) / elapsed * 60,
+            "generated_per_sec": (self.generated - self.last["generated"]) / elapsed,
+            "trained_per_sec": (self.trained - self.last["trained"]) / elapsed,
+            "reuse": self.trained / max(self.generated, 1),
+            "staleness": self.staleness,
+            "window": window_size,
+            "loss": self.loss,
+        }
+        self.last = {"games": self.games, "generated": self.generated, "trained": self.trained}
+        self.last_report = now
+        print(f"[pipeline] v{version} games={self.games} gen={metrics['generated_per_sec']:.1f}/s "
+              f"train={metrics['trained_per_sec']:.1f}/s reuse={metrics['reuse']:.2f} "
+              f"staleness={self.staleness:.2f} window={window_size} loss={self.loss:.4f}")
+        if self.path:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(metrics) + "\n")
+
+
+def main():
+    ctx = worker_context()
+
+    model_path = "model.pt"
+    model = AlphaZeroNet()
+    if os.path.exists(model_path):
+        model.load_state_dict(torch.load(model_path, map_location=get_device()))
+    trainer = AlphaZeroTrainer(model, batch_size=BATCH_SIZE)
+
+    # Store tạo trước khi spawn actor; learner chỉ đọc theo chỉ số
+    stores = [ReplayStore(actor_store_dir(i)) for i in range(NUM_ACTORS)]
+    sampler = ReplaySampler(stores, window=WINDOW_SIZE // NUM_ACTORS, recency_half_life=RECENCY_HALF_LIFE)
+
+    checkpoints = CheckpointManager(CHECKPOINT_DIR)
+    dashboard = Dashboard()
+    state = checkpoints.load(trainer, sampler)
+    if state is not None:
+        dashboard.steps = state["iteration"]
+        dashboard.games = state["extra"].get("games", 0)
+        dashboard.generated = state["extra"].get("generated", 0)
+        dashboard.trained = state["extra"].get("trained", 0)
+        dashboard.last = {"games": dashboard.games, "generated": dashboard.generated, "trained": dashboard.trained}
+
+    shared_weights = SharedWeights(trainer.model, ctx=ctx)
+    if state is not None:
+        # Tiếp tục đánh số version để staleness của sample cũ trong store vẫn đúng
+        shared_weights.version.value = state["extra"].get("version", 0)
+    version = shared_weights.publish(trainer.model)
+    sample_queue = ctx.Queue()
+    stop_event = ctx.Event()
+    actors = []
+    for i in range(NUM_ACTORS):
+        p = ctx.Process(target=run_actor, args=(i, shared_weights, sample_queue, stop_event))
+        p.start()
+        actors.append(p)
+
+    def receive(timeout=None):
+        try:
+            _, sample_version, num_samples = sample_queue.get(timeout=timeout)
+        except queue.Empty:
+            return False
+        dashboard.record_game(num_samples)
+        return True
+
+    try:
+        while dashboard.steps < TOTAL_STEPS:
+            # Nhận hết các ván actor đã gửi
+            while receive(timeout=0.0):
+                pass
+
+            # Chưa đủ dữ liệu hoặc đã train quá tỉ lệ reuse: chờ thêm ván mới
+            if len(sampler) < MIN_SAMPLES or dashboard.trained >= TARGET_REUSE * dashboard.generated:
+                with profiler.span("learner.wait_data"):
+                    receive(timeout=1.0)
+                dashboard.maybe_report(version, len(sampler))
+                continue
+
+            with profiler.span("learner.sample"):
+                states, policies, values, versions = sample_to_device(sampler.sample(BATCH_SIZE))
+            loss = trainer.train_batch(states, policies, values)
+            dashboard.record_batch(len(versions), loss, version - float(versions.mean()))
+
+            if dashboard.steps % PUBLISH_EVERY == 0:
+                version = shared_weights.publish(trainer.model)
+                trainer.save_model(model_path)
+                checkpoints.save(dashboard.steps, trainer, sampler, extra={
+                    "version": version, "games": dashboard.games, "generated": dashboard.generated, "trained": dashboard.trained,
+                })
+            dashboard.maybe_report(version, len(sampler))
+    except KeyboardInterrupt:
+        print("[pipeline] Dừng theo yêu cầu")
+    finally:
+        stop_event.set()
+        trainer.save_model(model_path)
+        # Checkpoint cuối để không mất tới PUBLISH_EVERY bước optimizer / scheduler khi dừng giữa chừng
+        checkpoints.save(dashboard.steps, trainer, sampler, extra={
+            "version": version, "games": dashboard.games, "generated": dashboard.generated, "trained": dashboard.trained,
+        })
+        checkpoints.close()
+        dashboard.maybe_report(version, len(sampler), force=True)
+        # Xả queue để actor không bị chặn khi thoát
+        deadline = time.time() + 60
+        while any(p.is_alive() for p in actors) and time.time() < deadline:
+            receive(timeout=0.5)
+        for p in actors:
+            if p.is_alive():
+                p.terminate()
+            p.join()
+
+
+if __name__ == "__main__":
+    main()
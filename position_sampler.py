@@ -0,0 +1,113 @@
+import os
+import glob
+import random
+import numpy as np
+import chess
+import chess.polyglot
+
+# Chọn thế cờ để gửi Stockfish gán nhãn, thay vì phân tích mọi nước của mọi ván:
+#   - bỏ các nước khai cuộc đầu ván (gần như trùng nhau giữa các ván)
+#   - mỗi ván lấy tối đa positions_per_game thế cờ ngẫu nhiên
+#   - bỏ thế cờ đã gán nhãn (khóa Zobrist, lưu ra file để dùng lại giữa các lần chạy / worker)
+#   - giữ tỉ lệ khai cuộc / trung cuộc / tàn cuộc theo phase_quota
+PHASES = ("opening", "middlegame", "endgame")
+DEFAULT_PHASE_QUOTA = {"opening": 0.2, "middlegame": 0.5, "endgame": 0.3}
+QUOTA_SLACK = 20  # cho phép vượt quota một chút để không kẹt lúc mới bắt đầu
+SEEN_FILE = "labelled_keys.npy"
+
+PHASE_WEIGHTS = {chess.KNIGHT: 1, chess.BISHOP: 1, chess.ROOK: 2, chess.QUEEN: 4}
+
+
+def game_phase(board):
+    # Theo lượng quân (không tính tốt, vua): đủ quân = 24
+    material = sum(weight * chess.popcount(board.pieces_mask(piece_type, chess.WHITE) |
+                                           board.pieces_mask(piece_type, chess.BLACK))
+                   for piece_type, weight in PHASE_WEIGHTS.items())
+    if material >= 20:
+        return "opening"
+    if material > 8:
+        return "middlegame"
+    return "endgame"
+
+
+class PositionSampler:
+    def __init__(self, positions_per_game=8, skip_opening_plies=10, phase_quota=DEFAULT_PHASE_QUOTA,
+                 min_legal_moves=2, seen=None, seen_path=None, seed=None):
+        self.positions_per_game = positions_per_game  # None = lấy hết
+        self.skip_opening_plies = skip_opening_plies
+        self.phase_quota = phase_quota  # None = không giới hạn theo giai đoạn
+        self.min_legal_moves = min_legal_moves  # thế cờ chỉ có một nước hợp lệ không đáng phân tích
+        # seen: khóa đã gán nhãn ở mọi nơi (bỏ qua), labelled: khóa do sampler này chọn, ghi ra seen_path
+        self.seen = set(seen) if seen else set()
+        self.seen_path = seen_path
+        self.labelled = set()
+        if seen_path is not None and os.path.exists(seen_path):
+            self.labelled.update(int(key) for key in np.load(seen_path))
+            self.seen.update(self.labelled)
+        self.rng = random.Random(seed)
+
+        self.phase_counts = {phase: 0 for phase in PHASES}
+        self.considered = 0
+        self.duplicates = 0
+        self.over_quota = 0
+        self.selected = 0
+
+    def select(self, game):
+        # Trả về list board (theo thứ tự nước đi) cần gán nhãn trong ván này
+        board = game.board()
+        candidates = []
+        for ply, move in enumerate(game.mainline_moves()):
+            if ply >= self.skip_opening_plies:
+                candidates.append(board.copy())
+            board.push(move)
+        self.considered += len(candidates)
+
+        order = list(range(len(candidates)))
+        self.rng.shuffle(order)
+        chosen = []
+        for i in order:
+            if self.positions_per_game is not None and len(chosen) >= self.positions_per_game:
+                break
+            candidate = candidates[i]
+            if candidate.legal_moves.count() < self.min_legal_moves:
+                continue
+            key = chess.polyglot.zobrist_hash(candidate)
+            if key in self.seen:
+                self.duplicates += 1
+                continue
+            phase = game_phase(candidate)
+            if not self._under_quota(phase):
+                self.over_quota += 1
+                continue
+            self.seen.add(key)
+            self.labelled.add(key)
+            self.phase_counts[phase] += 1
+            self.selected += 1
+            chosen.append(i)
+        return [candidates[i] for i in sorted(chosen)]
+
+    def _under_quota(self, phase):
+        if self.phase_quota is None:
+            return True
+        limit = self.phase_quota.get(phase, 0.0) * (self.selected + 1) + QUOTA_SLACK
+        return self.phase_counts[phase] + 1 <= limit
+
+    def stats(self):
+        phases = ", ".join(f"{phase} {count}" for phase, count in self.phase_counts.items())
+        return (f"xét {self.considered}, chọn {self.selected} ({phases}), "
+                f"trùng {self.duplicates}, vượt quota {self.over_quota}")
+
+    def save_seen(self):
+        if self.seen_path is None:
+            return
+        tmp_path = self.seen_path + ".tmp.npy"
+        np.save(tmp_path, np.fromiter(self.labelled, dtype=np.uint64, count=len(self.labelled)))
+        os.replace(tmp_path, self.seen_path)
+
+
+def load_seen(root_dir):
+    # Gộp khóa đã gán nhãn từ mọi thư mục con (mọi file / worker đã chạy trước đó)
+    seen = set()
+    for path in glob.glob(os.path.join(root_dir, "**", SEEN_FILE), recursive=True):
+        seen.update(int(key) for key in np.load(path))
+    return seen
@@ -0,0 +1,142 @@
+import os
+import threading
+import chess
+import chess.polyglot
+import chess.syzygy
+
+
+# Sách khai cuộc Polyglot (.bin): trả nước ngay ở root thay vì search
+class OpeningBook:
+    def __init__(self, path, random_choice=True):
+        self.path = path
+        self.reader = chess.polyglot.open_reader(path)
+        self.random_choice = random_choice
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def move(self, board):
+        with self.lock:
+            try:
+                if self.random_choice:
+                    entry = self.reader.weighted_choice(board)
+                else:
+                    entry = self.reader.find(board)
+            except IndexError:
+                self.misses += 1
+                return None
+        if entry.move not in board.legal_moves:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry.move
+
+    def close(self):
+        self.reader.close()
+
+
+# Syzygy tablebase local: nước tốt nhất ở root và giá trị chính xác ở lá của MCTS
+class Tablebase:
+    def __init__(self, path):
+        self.path = path
+        self.tablebase = chess.syzygy.Tablebase()
+        for directory in path.split(os.pathsep):
+            if os.path.isdir(directory):
+                self.tablebase.add_directory(directory)
+        self.max_pieces = max_pieces_in(path)
+        self.lock = threading.Lock()
+        self.root_hits = 0
+        self.leaf_hits = 0
+        self.probes = 0
+
+    def can_probe(self, board):
+        return chess.popcount(board.occupied) <= self.max_pieces and not board.castling_rights
+
+    def probe_wdl(self, board):
+        # WDL theo góc nhìn bên tới lượt: 2 thắng, 0 hòa, -2 thua (±1: thắng/thua nhưng bị luật 50 nước)
+        if not self.can_probe(board):
+            return None
+        with self.lock:
+            self.probes += 1
+            try:
+                return self.tablebase.probe_wdl(board)
+            except KeyError:
+                return None
+
+    def value(self, board):
+        # Giá trị dùng làm kết quả chính xác ở lá MCTS, cùng thang với value của model
+        wdl = self.probe_wdl(board)
+        if wdl is None:
+            return None
+        self.leaf_hits += 1
+        if wdl >= 2:
+            return 1
+        if wdl <= -2:
+            return -1
+        return 0
+
+    def best_move(self, board):
+        if not self.can_probe(board):
+            return None
+        # Push/pop trên bản copy, không động vào board của người gọi
+        board = board.copy()
+        best_key = None
+        best_move = None
+        with self.lock:
+            for move in board.legal_moves:
+                board.push(move)
+                try:
+                    wdl = -self.tablebase.probe_wdl(board)
+                    dtz = -self.tablebase.probe_dtz(board)
+                except KeyError:
+                    return None
+                finally:
+                    board.pop()
+                zeroing = board.is_zeroing(move)
+                if wdl > 0:
+                    # Thắng: ưu tiên nước reset đếm 50 nước, rồi DTZ ngắn nhất
+                    key = (wdl, 1 if zeroing else 0, -abs(dtz))
+                elif wdl < 0:
+                    # Thua: kéo dài nhất có thể
+                    key = (wdl, 0, abs(dtz))
+                else:
+                    key = (wdl, 0, 0)
+                if best_key is None or key > best_key:
+                    best_key = key
+                    best_move = move
+            self.probes += 1
+        if best_move is not None:
+            self.root_hits += 1
+        return best_move
+
+    def close(self):
+        self.tablebase.close()
+
+
+def max_pieces_in(path):
+    # Số quân lớn nhất trong các bảng WDL có trong thư mục, vd KQvK.rtbw -> 3
+    pieces = 0
+    for directory in path.split(os.pathsep):
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            stem, ext = os.path.splitext(name)
+            if ext == ".rtbw":
+                pieces = max(pieces, len(stem.replace("v", "")))
+    return pieces
+
+
+def open_book(path, random_choice=True):
+    if not path or not os.path.exists(path):
+        return None
+    return OpeningBook(path, random_choice=random_choice)
+
+
+def open_tablebase(path):
+    if not path or not any(os.path.isdir(d) for d in path.split(os.pathsep)):
+        return None
+    tablebase = Tablebase(path)
+    if tablebase.max_pieces == 0:
+        tablebase.close()
+        return None
+    return tablebase
@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import contextlib
+
+# Bật bằng biến môi trường, ví dụ: CHESS_AI_PROFILE=trace.json python training.py
+# Trace ghi theo định dạng Chrome trace (mở bằng chrome://tracing hoặc ui.perfetto.dev).
+# Process con (worker) ghi ra file riêng có thêm pid: trace.<pid>.json
+PROFILE_ENV = "CHESS_AI_PROFILE"
+SUMMARY_INTERVAL_ENV = "CHESS_AI_PROFILE_INTERVAL"
+# pid của process chính, đặt khi process đầu tiên bật profiler và được process con thừa kế qua môi trường
+ROOT_PID_ENV = "CHESS_AI_PROFILE_ROOT_PID"
+
+# Dùng chung khi tắt profiler, gần như không tốn chi phí
+NULL_SPAN = contextlib.nullcontext()
+
+
+class Span:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter() - self.start)
+        return False
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.trace_path = None
+        self.root_pid = None
+        self.summary_interval = None
+        self.finished = False
+        self.max_events = 2_000_000
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.events = []
+        self.timers = {}  # name -> [count, total_seconds, max_seconds]
+        self.counters = {}
+        self.origin = time.perf_counter()
+        self.last_summary = self.origin
+
+    def enable(self, trace_path=None, summary_interval=None, root_pid=None):
+        self.reset()
+        self.trace_path = trace_path
+        self.root_pid = root_pid
+        self.summary_interval = summary_interval
+        self.finished = False
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def record(self, name, start, duration):
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = [0, 0.0, 0.0]
+            timer[0] += 1
+            timer[1] += duration
+            timer[2] = max(timer[2], duration)
+            if self.trace_path and len(self.events) < self.max_events:
+                self.events.append({
+                    "name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                    "ts": (start - self.origin) * 1e6, "dur": duration * 1e6,
+                })
+
+    def tick(self):
+        # Gọi định kỳ từ các vòng lặp chính để in tóm tắt mỗi summary_interval giây
+        if not self.enabled or self.summary_interval is None:
+            return
+        now = time.perf_counter()
+        if now - self.last_summary < self.summary_interval:
+            return
+        self.last_summary = now
+        with self.lock:
+            if self.trace_path and len(self.events) < self.max_events:
+                self.events.append({
+                    "name": "counters", "ph": "C", "pid": os.getpid(), "tid": 0,
+                    "ts": (now - self.origin) * 1e6, "args": dict(self.counters),
+                })
+        print(self.summary(), file=sys.stderr, flush=True)
+
+    def summary(self):
+        with self.lock:
+            timers = sorted(self.timers.items(), key=lambda x: -x[1][1])
+            counters = sorted(self.counters.items())
+        wall = time.perf_counter() - self.origin
+        lines = [f"[profile pid={os.getpid()}] wall {wall:.1f}s"]
+        for name, (count, total, longest) in timers:
+            lines.append(f"  {name:28s} n={count:<9d} total={total:9.3f}s "
+                         f"mean={total / count * 1000:9.3f}ms max={longest * 1000:9.3f}ms "
+                         f"({total / wall * 100:5.1f}% wall)")
+        for name, value in counters:
+            lines.append(f"  {name:28s} {value}")
+        return "\n".join(lines)
+
+    def output_path(self):
+        # Tính lúc lưu chứ không lúc import: process fork ra (forkserver) thừa kế profiler đã bật từ process cha
+        if not self.trace_path or self.root_pid is None or os.getpid() == self.root_pid:
+            return self.trace_path
+        root, ext = os.path.splitext(self.trace_path)
+        return f"{root}.{os.getpid()}{ext or '.json'}"
+
+    def save(self, path=None):
+        path = path or self.output_path()
+        if not path:
+            return
+        with self.lock:
+            events = list(self.events)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def finish(self):
+        # Lưu trace và in tóm tắt một lần; worker gọi tường minh vì process forkserver thoát bằng os._exit,
+        # không chạy atexit
+        if not self.enabled or self.finished:
+            return
+        self.finished = True
+        self.save()
+        print(self.summary(), file=sys.stderr, flush=True)
+
+
+profiler = Profiler()
+
+
+def _enable_from_env():
+    trace_path = os.environ.get(PROFILE_ENV)
+    if not trace_path:
+        return
+    root_pid = int(os.environ.setdefault(ROOT_PID_ENV, str(os.getpid())))
+    interval = os.environ.get(SUMMARY_INTERVAL_ENV)
+    profiler.enable(trace_path, float(interval) if interval else 10.0, root_pid)
+    atexit.register(profiler.finish)
+
+
+_enable_from_env()
@@ -1,5 +1,6 @@
 import os
 import torch
+import numpy as np
 
 def load_buffer(filepath):
     try:
@@ -37,3 +38,156 @@ def add_games_to_buffer(buffer, new_games, max_size=200000):
     if len(buffer) > max_size:
         buffer = buffer[-max_size:]
     return buffer
+
+
+# Replay store trên đĩa (np.memmap), mỗi worker một thư mục, dạng ring buffer.
+# State lưu uint8 (các plane đều 0/1), policy lưu thưa (tối đa POLICY_SLOTS nước) để store lớn hơn RAM.
+POLICY_SIZE = 4672
+POLICY_SLOTS = 256  # > số nước hợp lệ tối đa (218)
+
+
+class ReplayStore:
+    def __init__(self, directory, capacity=200000, mode="r+"):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, "meta.npy")
+        if not os.path.exists(meta_path):
+            if mode == "r":
+                raise FileNotFoundError(f"Replay store '{directory}' chưa được tạo")
+            self._create(capacity)
+        self.meta = np.lib.format.open_memmap(meta_path, mode=mode)
+        self.capacity = int(self.meta[1])
+        self.states = self._open("states", mode)
+        self.policy_index = self._open("policy_index", mode)
+        self.policy_prob = self._open("policy_prob", mode)
+        self.values = self._open("values", mode)
+        self.versions = self._open("versions", mode)
+
+    def _create(self, capacity):
+        def create(name, dtype, shape):
+            array = np.lib.format.open_memmap(os.path.join(self.directory, f"{name}.npy"), mode="w+",
+                                              dtype=dtype, shape=shape)
+            del array
+
+        create("states", np.uint8, (capacity, 20, 8, 8))
+        create("policy_index", np.int16, (capacity, POLICY_SLOTS))
+        create("policy_prob", np.float32, (capacity, POLICY_SLOTS))
+        create("values", np.float32, (capacity,))
+        create("versions", np.int32, (capacity,))
+        # meta = [tổng số sample đã ghi, capacity]; ghi sau cùng để reader chỉ thấy dòng đã ghi xong
+        meta = np.lib.format.open_memmap(os.path.join(self.directory, "meta.npy"), mode="w+",
+                                         dtype=np.int64, shape=(2,))
+        meta[1] = capacity
+        meta.flush()
+        del meta
+
+    def _open(self, name, mode):
+        return np.lib.format.open_memmap(os.path.join(self.directory, f"{name}.npy"), mode=mode)
+
+    @property
+    def total(self):
+        return int(self.meta[0])
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def append(self, samples, version=0):
+        total = self.total
+        for state, policy, value in samples:
+            row = total % self.capacity
+            state = state.numpy() if hasattr(state, "numpy") else np.asarray(state)
+            self.states[row] = state.astype(np.uint8)
+            policy = np.asarray(policy, dtype=np.float32)
+            index = np.flatnonzero(policy)
+            if len(index) > POLICY_SLOTS:
+                index = index[np.argsort(policy[index])[-POLICY_SLOTS:]]
+            self.policy_index[row] = -1
+            self.policy_index[row, :len(index)] = index
+            self.policy_prob[row] = 0.0
+            self.policy_prob[row, :len(index)] = policy[index]
+            self.values[row] = value
+            self.versions[row] = version
+            total += 1
+        for array in (self.states, self.policy_index, self.policy_prob, self.values, self.versions):
+            array.flush()
+        self.meta[0] = total
+        self.meta.flush()
+
+    def read(self, rows):
+        # rows: chỉ số vật lý (đã mod capacity), trả về numpy dense
+        rows = np.sort(np.asarray(rows))
+        states = self.states[rows].astype(np.float32)
+        policies = np.zeros((len(rows), POLICY_SIZE), dtype=np.float32)
+        index = self.policy_index[rows].astype(np.int64)
+        prob = self.policy_prob[rows]
+        mask = index >= 0
+        policies[np.nonzero(mask)[0], index[mask]] = prob[mask]
+        return states, policies, self.values[rows].copy(), self.versions[rows].copy()
+
+
+class ReplaySampler:
+    # Lấy batch trực tiếp từ các ReplayStore theo chỉ số, không gộp buffer vào RAM.
+    #   window: chỉ lấy trong `window` sample mới nhất của mỗi store (None = toàn bộ)
+    #   recency_half_life: None = đều; số sample = sample cũ hơn chừng đó có xác suất giảm một nửa
+    def __init__(self, stores, window=None, recency_half_life=None, seed=None):
+        self.stores = stores
+        self.window = window
+        self.recency_half_life = recency_half_life
+        self.rng = np.random.default_rng(seed)
+
+    def available(self):
+        sizes = [len(store) for store in self.stores]
+        if self.window is not None:
+            sizes = [min(size, self.window) for size in sizes]
+        return sizes
+
+    def __len__(self):
+        return sum(self.available())
+
+    def sample_rows(self, batch_size):
+        sizes = np.array(self.available(), dtype=np.float64)
+        if sizes.sum() == 0:
+            return []
+        counts = self.rng.multinomial(batch_size, sizes / sizes.sum())
+        picks = []
+        for store, size, count in zip(self.stores, sizes.astype(np.int64), counts):
+            if count == 0:
+                continue
+            if self.recency_half_life:
+                # Phân phối hình học cắt ở [0, size) (inverse CDF), không dồn phần đuôi vào dòng cũ nhất
+                decay = 0.5 ** (1 / self.recency_half_life)
+                u = self.rng.random(count)
+                ages = np.floor(np.log1p(-u * (1 - decay ** size)) / np.log(decay)).astype(np.int64)
+                ages = np.clip(ages, 0, size - 1)
+            else:
+                ages = self.rng.integers(0, size, size=count)
+            rows = (store.total - 1 - ages) % store.capacity
+            picks.append((store, rows))
+        return picks
+
+    def sample(self, batch_size):
+        parts = [store.read(rows) for store, rows in self.sample_rows(batch_size)]
+        if not parts:
+            return None
+        states, policies, values, versions = (np.concatenate(column) for column in zip(*parts))
+        return states, policies, values, versions
+
+    def state_dict(self):
+        return {"rng": self.rng.bit_generator.state, "totals": [store.total for store in self.stores]}
+
+    def load_state_dict(self, state):
+        # Chỉ khôi phục RNG; sample self-play ghi sau checkpoint được giữ lại (cắt bỏ sẽ mất cả những ván đó).
+        # Vì vậy batch sau resume chỉ giống lần chạy liền mạch khi store không có dòng mới sau checkpoint.
+        self.rng.bit_generator.state = state["rng"]
+        newer = sum(store.total - total for store, total in zip(self.stores, state.get("totals", [])))
+        if newer > 0:
+            print(f"[Checkpoint] Giữ {newer} sample ghi sau checkpoint")
+
+
+def migrate_buffer(buffer_path, store):
+    # Chuyển buffer .pt cũ (list (state, policy, value)) sang ReplayStore nếu store còn trống
+    if store.total > 0 or not os.path.exists(buffer_path):
+        return 0
+    buffer = load_buffer(buffer_path)
+    store.append(buffer)
+    return len(buffer)
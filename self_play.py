@@ -4,14 +4,31 @@ import numpy as np
 from mcts import MCTS
 from model import AlphaZeroNet
 from utils import board_to_tensor, get_policy_vector
+from profiler import profiler
 
 class SelfPlay:
-    def __init__(self, model, time_limit, board, board_size=600):
+    # Playout-cap randomization: mỗi nước search đầy đủ (time_limit, có nhiễu, được lưu làm target policy)
+    # với xác suất full_search_prob, còn lại search nhanh (fast_time_limit, không nhiễu, không lưu).
+    def __init__(self, model, time_limit, board, board_size=600, book=None, tablebase=None,
+                 full_search_prob=0.25, fast_time_limit=None, dirichlet_alpha=0.3, dirichlet_epsilon=0.25,
+                 temperature=1.0, temperature_moves=15, final_temperature=0.5, seed=None, adjudicator=None):
         self.model = model
         self.time_limit = time_limit
+        self.fast_time_limit = fast_time_limit if fast_time_limit is not None else time_limit / 4
+        self.full_search_prob = full_search_prob
+        self.dirichlet_epsilon = dirichlet_epsilon
+        self.temperature = temperature
+        self.temperature_moves = temperature_moves  # số nước đầu dùng temperature, sau đó final_temperature
+        self.final_temperature = final_temperature
+        self.rng = np.random.default_rng(seed)
         self.board = board
-        self.mcts = MCTS(model, time_limit=self.time_limit)
+        self.mcts = MCTS(model, time_limit=self.time_limit, book=book, tablebase=tablebase,
+                         dirichlet_alpha=dirichlet_alpha, seed=seed)
         self.board_size = board_size
+        self.full_searches = 0
+        self.fast_searches = 0
+        self.adjudicator = adjudicator  # adjudication.Adjudicator dùng chung qua các ván (None = đánh hết ván)
+        self.adjudication = None  # (result, reason) nếu ván bị xử sớm
         
         # Khởi tạo Pygame
         pygame.init()
@@ -25,6 +42,7 @@ class SelfPlay:
         
         # Tải hình ảnh quân cờ
         self.piece_images = self.load_piece_images()
+        self.scaled_images = {}
 
     def load_piece_images(self):
         piece_images = {}
@@ -32,11 +50,21 @@ class SelfPlay:
         colors = ['w', 'b']
         for color in colors:
             for piece in pieces:
-                piece_images[f'{piece}{color}'] = pygame.image.load(f"images/{piece}{color}.png")
+                piece_images[f'{piece}{color}'] = pygame.image.load(f"data/images/{piece}{color}.png")
         return piece_images
 
+    def get_scaled_images(self, square_size):
+        # Scale một lần cho mỗi kích thước ô thay vì mỗi quân mỗi frame
+        if square_size not in self.scaled_images:
+            self.scaled_images[square_size] = {
+                name: pygame.transform.scale(image, (square_size, square_size))
+                for name, image in self.piece_images.items()
+            }
+        return self.scaled_images[square_size]
+
     def draw_board(self):
         square_size = self.board_size // 8
+        piece_images = self.get_scaled_images(square_size)
         # Vẽ ô cờ
         for rank in range(8):
             for file in range(8):
@@ -50,18 +78,20 @@ class SelfPlay:
                 row, col = divmod(square, 8)
                 row = 7 - row  # Sửa tọa độ
                 piece_name = f"{piece.symbol().lower()}{'w' if piece.color == chess.WHITE else 'b'}"
-                image = self.piece_images.get(piece_name)
+                image = piece_images.get(piece_name)
                 if image:
-                    image = pygame.transform.scale(image, (square_size, square_size))
                     self.screen.blit(image, (col * square_size, row * square_size))
 
-    def play_game(self):
+    def play_game(self, max_moves=None):
         game_data = []
         game_result = None
         turn = chess.WHITE
         move_count = 0
+        adjudication = self.adjudicator.new_game() if self.adjudicator is not None else None
 
         while not self.board.is_game_over():
+            if max_moves is not None and move_count >= max_moves:
+                break
             # Xử lý sự kiện
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
@@ -69,39 +99,65 @@ class SelfPlay:
                     return
 
             # Vẽ bàn cờ
-            self.screen.fill((200, 200, 200))
-            self.draw_board()
-            pygame.display.flip()
+            with profiler.span("selfplay.render"):
+                self.screen.fill((200, 200, 200))
+                self.draw_board()
+                pygame.display.flip()
 
             if self.board.turn == turn:
                 pygame.event.pump()  # Giữ GUI phản hồi
 
+                # Tablebase / giới hạn nước: xử trước khi search
+                if adjudication is not None:
+                    self.adjudication = adjudication.check(self.board)
+                    if self.adjudication is not None:
+                        break
+
                 # Điều chỉnh temperature theo số lượng nước đi
-                temperature = 1.0 if move_count < 15 else 0.5
+                temperature = self.temperature if move_count < self.temperature_moves else self.final_temperature
                 move_count += 1
-                
-                # Đặt temperature cho MCTS
                 self.mcts.temperature = temperature
-                
-                # Tìm nước đi bằng MCTS
-                move = self.mcts.search(self.board)
+
+                # Search đầy đủ (có nhiễu, được lưu) hay search nhanh
+                full = self.rng.random() < self.full_search_prob
+                self.mcts.dirichlet_epsilon = self.dirichlet_epsilon if full else 0.0
+                with profiler.span("selfplay.search" if full else "selfplay.fast_search"):
+                    move = self.mcts.search(self.board, time_limit=self.time_limit if full else self.fast_time_limit)
                 if move is None:
                     print("No move found by MCTS. Ending game early.")
                     break
+                if full:
+                    self.full_searches += 1
+                else:
+                    self.fast_searches += 1
 
-                # Lưu trạng thái trước khi đẩy nước đi
-                state = board_to_tensor(self.board.copy())
-                policy = get_policy_vector(self.board, self.mcts.root)
-                game_data.append((state, policy, 0))  # tạm thời gán value = 0
+                # Lưu trạng thái trước khi đẩy nước đi (nước từ sách / tablebase không có policy để học)
+                if full and self.mcts.root is not None:
+                    with profiler.span("selfplay.record"):
+                        state = board_to_tensor(self.board.copy())
+                        policy = get_policy_vector(self.board, self.mcts.root)
+                        game_data.append((state, policy, self.board.turn))  # value gán sau theo bên đi
+
+                if adjudication is not None:
+                    self.adjudication = adjudication.update(self.board, self.mcts.root_value())
+                    if self.adjudication is not None:
+                        break
 
                 self.board.push(move)
+                profiler.count("selfplay.plies")
+                profiler.tick()
             else:
                 pygame.time.wait(500)
 
             turn = not turn
 
-        # Kết quả ván cờ
-        result = self.board.result()
+        # Kết quả ván cờ (ván bị xử sớm theo adjudicator, ván bị cắt ở max_moves tính là hòa)
+        if self.adjudication is not None:
+            result = self.adjudication[0]
+        else:
+            result = self.board.result() if self.board.is_game_over() else "1/2-1/2"
+        if adjudication is not None:
+            adjudication.finish(result, len(self.board.move_stack))
         if result == "1-0":
             game_result = 1
         elif result == "0-1":
@@ -110,6 +166,6 @@ class SelfPlay:
             game_result = 0
 
         # Gán lại value cho từng trạng thái
-        game_data = [(s, p, game_result if i % 2 == 0 else -game_result) for i, (s, p, _) in enumerate(game_data)]
+        game_data = [(s, p, game_result if side == chess.WHITE else -game_result) for s, p, side in game_data]
 
         return game_data, game_result
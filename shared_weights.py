@@ -0,0 +1,32 @@
+import torch
+import torch.multiprocessing as mp
+
+
+# Trọng số model đặt trong shared memory (CPU) kèm số version.
+# Learner gọi publish() sau khi train; worker gọi pull() giữa các ván để cập nhật mà không cần
+# khởi động lại process hay đọc model.pt từ đĩa.
+class SharedWeights:
+    def __init__(self, model, ctx=None):
+        ctx = ctx or mp.get_context("spawn")
+        self.tensors = {
+            name: tensor.detach().cpu().clone().share_memory_()
+            for name, tensor in model.state_dict().items()
+        }
+        self.version = ctx.Value("i", 0)
+        self.lock = ctx.Lock()
+
+    def publish(self, model):
+        with self.lock:
+            with torch.no_grad():
+                for name, tensor in model.state_dict().items():
+                    self.tensors[name].copy_(tensor.detach().cpu())
+            self.version.value += 1
+            return self.version.value
+
+    def pull(self, model, current_version=-1):
+        # Trả về version đang dùng; chỉ copy khi có version mới
+        if self.version.value == current_version:
+            return current_version
+        with self.lock:
+            model.load_state_dict(self.tensors)
+            return self.version.value
@@ -0,0 +1,82 @@
+import zlib
+import chess
+import numpy as np
+import pytest
+from mcts import MCTS, check_tree
+
+# Kiểm tra bất biến visit count của MCTS (một lần backup mỗi simulation) cho search một thread và song song.
+# Model giả thay AlphaZeroNet: policy / value sinh từ feature plane, nhanh và không cần torch.
+FENS = [
+    chess.STARTING_FEN,
+    "r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4",  # chiếu hết sau một nước
+    "7k/5Q2/6K1/8/8/8/8/8 w - - 0 1",  # có nước hòa pat và nước chiếu hết: lá kết thúc
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+]
+SIMULATIONS = 300
+
+
+class StubModel:
+    def predict_planes(self, planes):
+        rng = np.random.default_rng(zlib.crc32(np.ascontiguousarray(planes).tobytes()))
+        policy = rng.random(4672).astype(np.float32)
+        return policy / policy.sum(), float(rng.uniform(-1, 1))
+
+    def predict_planes_batch(self, planes_list):
+        results = [self.predict_planes(planes) for planes in planes_list]
+        return np.stack([policy for policy, _ in results]), [value for _, value in results]
+
+
+def run_search(fen, num_threads):
+    mcts = MCTS(StubModel(), time_limit=None, num_threads=num_threads, batch_size=4, seed=0)
+    move = mcts.search(chess.Board(fen), max_simulations=SIMULATIONS)
+    return mcts, move
+
+
+@pytest.mark.parametrize("num_threads", [1, 4])
+@pytest.mark.parametrize("fen", FENS)
+def test_visit_counts(fen, num_threads):
+    mcts, move = run_search(fen, num_threads)
+    assert move in chess.Board(fen).legal_moves
+    assert mcts.simulations >= SIMULATIONS
+    assert mcts.root.visit_count == mcts.simulations
+    check_tree(mcts.root)
+
+
+def test_finds_mate_in_one():
+    mcts, move = run_search(FENS[1], 1)
+    assert move == chess.Move.from_uci("h5f7")
+
+
+class StubTablebase:
+    # Tablebase chỉ có WDL: value ở lá nhưng không có nước tốt nhất ở root (best_move None)
+    def can_probe(self, board):
+        return True
+
+    def value(self, board):
+        return 0
+
+    def best_move(self, board):
+        return None
+
+
+def test_reused_tablebase_leaf_root():
+    board = chess.Board("8/8/4k3/8/8/3Q4/8/4K3 w - - 0 1")
+    mcts = MCTS(StubModel(), time_limit=None, tablebase=StubTablebase(), seed=0)
+    mcts.search(board, max_simulations=SIMULATIONS)
+    board.push(chess.Move.from_uci("d3d5"))
+    mcts.search(board, max_simulations=SIMULATIONS)
+    check_tree(mcts.root)
+    assert mcts.root.visit_count == mcts.simulations
+    assert sum(child.visit_count for child in mcts.root.children.values()) == mcts.simulations
+
+
+class FailingModel(StubModel):
+    def predict_planes_batch(self, planes_list):
+        raise RuntimeError("model lỗi")
+
+
+def test_parallel_search_reports_model_error():
+    mcts = MCTS(FailingModel(), time_limit=None, num_threads=4, batch_size=4, seed=0)
+    with pytest.raises(RuntimeError, match="model lỗi"):
+        mcts.search(chess.Board(), max_simulations=SIMULATIONS)
+    check_tree(mcts.root)
@@ -0,0 +1,101 @@
+import time
+
+# Trừ hao độ trễ giao tiếp (GUI / tournament manager)
+MOVE_OVERHEAD = 0.05
+DEFAULT_MOVES_TO_GO = 30
+MIN_MOVE_TIME = 0.01
+
+
+# Chia thời gian mỗi nước từ đồng hồ, dừng sớm / kéo dài theo độ ổn định của nước tốt nhất.
+#   soft_limit: thời gian dự kiến khi nước tốt nhất ổn định
+#   hard_limit: không bao giờ vượt quá, dùng khi nước tốt nhất còn thay đổi
+class TimeManager:
+    def __init__(self, move_overhead=MOVE_OVERHEAD, moves_to_go=DEFAULT_MOVES_TO_GO,
+                 max_extension=2.5, instability_window=0.5, check_every=16):
+        self.move_overhead = move_overhead
+        self.moves_to_go = moves_to_go
+        self.max_extension = max_extension
+        self.instability_window = instability_window
+        self.check_every = check_every
+
+        self.soft_limit = None
+        self.hard_limit = None
+        self.start_time = time.time()
+        self.start_simulations = None
+        self.best_move = None
+        self.last_change = 0.0
+        self.extended = False
+
+        # Thống kê để đánh giá lượng thời gian tiết kiệm được
+        self.early_stops = 0
+        self.extensions = 0
+
+    def allocate(self, remaining, increment=0.0, moves_to_go=None):
+        # remaining / increment tính bằng giây
+        moves_to_go = moves_to_go or self.moves_to_go
+        usable = max(remaining - self.move_overhead, MIN_MOVE_TIME)
+        soft = usable / moves_to_go + increment * 0.75
+        hard = min(soft * self.max_extension, usable * 0.5)
+        soft = min(soft, hard)
+        return max(soft, MIN_MOVE_TIME), max(hard, MIN_MOVE_TIME)
+
+    def start(self, board, time_limit=None, remaining=None, increment=0.0, moves_to_go=None):
+        if remaining is not None:
+            soft, hard = self.allocate(remaining, increment, moves_to_go)
+        else:
+            # Thời gian cố định mỗi nước: chỉ dừng sớm, không kéo dài quá time_limit
+            soft, hard = time_limit, time_limit
+        if board.legal_moves.count() == 1 and hard is not None:
+            soft, hard = 0.0, 0.0
+        self.set_limits(soft, hard)
+
+    def set_limits(self, soft, hard=None):
+        self.soft_limit = soft
+        self.hard_limit = soft if hard is None else hard
+        self.start_time = time.time()
+        self.start_simulations = None
+        self.best_move = None
+        self.last_change = 0.0
+        self.extended = False
+
+    def elapsed(self):
+        return time.time() - self.start_time
+
+    def should_stop(self, root, simulations):
+        # Luôn chạy ít nhất một simulation để root có visit
+        if simulations == 0 or self.hard_limit is None:
+            return False
+        if self.start_simulations is None:
+            self.start_simulations = simulations
+        elapsed = self.elapsed()
+        if elapsed >= self.hard_limit:
+            return True
+        if simulations % self.check_every:
+            return False
+
+        ranked = sorted(root.children.items(), key=lambda x: x[1].visit_count, reverse=True)
+        best_move, best_visits = ranked[0][0], ranked[0][1].visit_count
+        second_visits = ranked[1][1].visit_count if len(ranked) > 1 else 0
+        if best_move != self.best_move:
+            self.best_move = best_move
+            self.last_change = elapsed
+
+        # Nước tốt nhất đổi gần đây -> kéo dài tới hard_limit
+        target = self.soft_limit
+        if self.last_change > self.soft_limit * self.instability_window:
+            target = self.hard_limit
+
+        # Dừng sớm khi số simulation còn lại không thể giúp nước thứ hai vượt nước tốt nhất
+        done = simulations - self.start_simulations
+        if done > 0 and elapsed > 0:
+            remaining_simulations = done / elapsed * max(target - elapsed, 0.0)
+            if best_visits - second_visits > remaining_simulations:
+                self.early_stops += 1
+                return True
+
+        if elapsed >= target:
+            return True
+        if elapsed >= self.soft_limit and not self.extended:
+            self.extended = True
+            self.extensions += 1
+        return False
@@ -4,34 +4,89 @@ import torch.optim as optim
 from torch.utils.data import DataLoader, TensorDataset
 import numpy as np
 from self_play import SelfPlay
-from model import AlphaZeroNet
+from model import AlphaZeroNet, get_device
 import chess
-from replay_buffer import load_buffer, save_buffer, add_games_to_buffer
+from replay_buffer import load_buffer, save_buffer, add_games_to_buffer, ReplayStore, ReplaySampler, migrate_buffer
 import os
 import multiprocessing
-import time
-import shutil
+import queue
+from profiler import profiler
+from probe import open_book, open_tablebase
+from shared_weights import SharedWeights
+from checkpoint import CheckpointManager
+from adjudication import Adjudicator
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f"Using device: {device}")
+# Sách khai cuộc Polyglot / thư mục Syzygy cho self-play (None = không dùng)
+BOOK_PATH = None
+SYZYGY_PATH = None
+
+# Mỗi worker ghi vào một replay store memmap riêng; learner lấy batch trực tiếp theo chỉ số
+REPLAY_WINDOW = 5000  # số sample mới nhất của mỗi worker được dùng để train (Đổi thành 10000 với gpu)
+
+# Train data-parallel trên CPU (xem data_parallel.py); 1 = train trong process chính
+TRAIN_RANKS = 1
+TRAIN_THREADS_PER_RANK = None  # None = số core / TRAIN_RANKS
+
+# Xử sớm ván self-play (resign / hòa / giới hạn nước / tablebase), xem adjudication.py; False = đánh hết ván
+ADJUDICATE = True
+RESIGN_THRESHOLD = -0.9
+PLAYTHROUGH_FRACTION = 0.1  # tỉ lệ ván vẫn đánh tiếp để đo resign sai và hiệu chỉnh ngưỡng
+
+# Kiểm tra worker còn sống mỗi WORKER_POLL giây khi chờ ván; worker chết được khởi động lại tối đa
+# MAX_WORKER_RESTARTS lần (mỗi worker) trước khi dừng training
+WORKER_POLL = 5.0
+MAX_WORKER_RESTARTS = 3
+
+
+# Worker self-play khởi động qua forkserver đã nạp sẵn torch + các module dưới đây: mỗi worker (kể cả khi
+# khởi động lại) chỉ fork, không phải import lại torch như spawn. Nền tảng không có forkserver (Windows) dùng spawn
+WORKER_PRELOAD = ["torch", "model", "mcts", "self_play", "replay_buffer"]
+
+
+def worker_context():
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(WORKER_PRELOAD)
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+def replay_store_dir(worker_id):
+    return f"replay_store_workers_{worker_id}"
+
+
+def sample_to_device(sample):
+    states, policies, values, versions = sample
+    return (
+        torch.from_numpy(states).to(get_device()),
+        torch.from_numpy(policies).to(get_device()),
+        torch.from_numpy(values).to(get_device()),
+        versions,
+    )
 
 class AlphaZeroTrainer:
-    def __init__(self, model, epochs=20, batch_size=64, learning_rate=1e-3):
-        self.model = model.to(device)
+    def __init__(self, model, epochs=20, batch_size=64, learning_rate=1e-3, scheduler_fn=None):
+        self.model = model.to(get_device())
         self.epochs = epochs
         self.batch_size = batch_size
         self.learning_rate = learning_rate
         self.optimizer = optim.Adam(self.model.parameters(), lr=self.learning_rate)
+        # scheduler_fn(optimizer) -> LR scheduler, step() mỗi lần train xong một iteration
+        self.scheduler = scheduler_fn(self.optimizer) if scheduler_fn is not None else None
+        # Model dùng cho forward khi train; data_parallel thay bằng bản bọc DistributedDataParallel
+        self.forward_model = self.model
+        self.verbose = True
         self.loss_fn = nn.MSELoss()
     
     def train(self, game_data):
         if not game_data:
             print("⚠️ Không có dữ liệu để train.")
             return
-        states, policies, values = zip(*game_data)
-        states = torch.stack(states).to(device)
-        policies = torch.tensor(np.array(policies), dtype=torch.float32).to(device)
-        values = torch.tensor(np.array(values), dtype=torch.float32).to(device)
+        with profiler.span("train.prepare"):
+            states, policies, values = zip(*game_data)
+            states = torch.stack(states).to(get_device())
+            policies = torch.tensor(np.array(policies), dtype=torch.float32).to(get_device())
+            values = torch.tensor(np.array(values), dtype=torch.float32).to(get_device())
         
         dataset = TensorDataset(states, policies, values)
         dataloader = DataLoader(dataset, batch_size=self.batch_size, shuffle=True)
@@ -40,98 +95,219 @@ class AlphaZeroTrainer:
             total_loss = 0
             for batch in dataloader:
                 state_batch, policy_batch, value_batch = batch
-                self.optimizer.zero_grad()
-                
-                policy_pred, value_pred = self.model(state_batch)
-                
-                value_loss = self.loss_fn(value_pred.view(-1), value_batch.view(-1))
-                policy_log_probs = torch.log_softmax(policy_pred, dim=1)
-                policy_loss = -torch.mean(torch.sum(policy_batch * policy_log_probs, dim=1))
-                
-                loss = policy_loss + value_loss
-                total_loss += loss.item()
-                loss.backward()
-                self.optimizer.step()
+                total_loss += self.train_batch(state_batch, policy_batch, value_batch)
             
             print(f"Epoch {epoch+1}/{self.epochs}, Loss: {total_loss / len(dataloader)}")
+        if self.scheduler is not None:
+            self.scheduler.step()
+
+    def train_from_sampler(self, sampler, num_batches=None):
+        # Như train() nhưng lấy từng batch từ ReplaySampler, mặc định mỗi epoch = số sample khả dụng / batch_size
+        available = len(sampler)
+        if available == 0:
+            print("⚠️ Không có dữ liệu để train.")
+            return
+        num_batches = num_batches or max(1, available // self.batch_size)
+        for epoch in range(self.epochs):
+            total_loss = 0
+            for _ in range(num_batches):
+                with profiler.span("train.sample"):
+                    states, policies, values, _ = sample_to_device(sampler.sample(self.batch_size))
+                total_loss += self.train_batch(states, policies, values)
+
+            if self.verbose:
+                print(f"Epoch {epoch+1}/{self.epochs}, Loss: {total_loss / num_batches}")
+        if self.scheduler is not None:
+            self.scheduler.step()
+
+    def train_batch(self, state_batch, policy_batch, value_batch):
+        # Một bước tối ưu trên một batch đã nằm trên device, trả về loss
+        self.model.train()
+        self.optimizer.zero_grad()
+
+        with profiler.span("train.forward"):
+            policy_pred, value_pred = self.forward_model(state_batch)
+
+            value_loss = self.loss_fn(value_pred.view(-1), value_batch.view(-1))
+            policy_log_probs = torch.log_softmax(policy_pred, dim=1)
+            policy_loss = -torch.mean(torch.sum(policy_batch * policy_log_probs, dim=1))
+
+            loss = policy_loss + value_loss
+        with profiler.span("train.backward"):
+            loss.backward()
+        with profiler.span("train.step"):
+            self.optimizer.step()
+        profiler.count("train.samples", len(state_batch))
+        profiler.tick()
+        return loss.item()
     
     def save_model(self, file_path):
         torch.save(self.model.state_dict(), file_path)
 
-def run_self_play_worker(worker_id, model_path, games_per_worker):
-    model = AlphaZeroNet().to(device)
-    model.load_state_dict(torch.load(model_path, map_location=device))
-    model.eval()
+def make_adjudicator(tablebase=None):
+    if not ADJUDICATE:
+        return None
+    return Adjudicator(resign_threshold=RESIGN_THRESHOLD, playthrough_fraction=PLAYTHROUGH_FRACTION,
+                       tablebase=tablebase)
+
+def run_self_play_worker(worker_id, shared_weights, task_queue, done_queue):
+    # Worker sống qua nhiều iteration: nhận từng ván qua task_queue, cập nhật trọng số từ shared memory giữa các ván
+    try:
+        model = AlphaZeroNet().to(get_device())
+        with profiler.span("worker.load_model"):
+            version = shared_weights.pull(model)
+        model.eval()
+
+        store = ReplayStore(replay_store_dir(worker_id))
+        book = open_book(BOOK_PATH)
+        tablebase = open_tablebase(SYZYGY_PATH)
+        adjudicator = make_adjudicator(tablebase)
+        skipped = 0
+
+        while True:
+            with profiler.span("worker.queue_wait"):
+                task = task_queue.get()
+            if task is None:
+                break
+            # Báo ván đang chơi để process chính giao lại đúng ván này nếu worker chết giữa chừng
+            done_queue.put(("started", worker_id, task))
+            with profiler.span("worker.load_model"):
+                version = shared_weights.pull(model, version)
 
-    buffer_file = f"replay_buffer_workers_{worker_id}.pt"
-    buffer = load_buffer(buffer_file)
+            print(f"[Worker {worker_id}] Game {task} (model v{version})")
+            board = chess.Board()
+            sp = SelfPlay(model, time_limit=1.0, board=board, book=book, tablebase=tablebase, adjudicator=adjudicator)
+            with profiler.span("worker.game"):
+                game_data, result = sp.play_game()
+            skipped += sp.mcts.skipped_searches
 
-    for i in range(games_per_worker):
-        print(f"[Worker {worker_id}] Game {i+1}/{games_per_worker}")
-        board = chess.Board()
-        sp = SelfPlay(model, time_limit=1.0, board=board)
-        game_data, result = sp.play_game()
+            if game_data:
+                with profiler.span("worker.save_buffer"):
+                    store.append(game_data, version)
+                print(f"[Worker {worker_id}] Game {task} saved. Result: {result}, "
+                      f"{len(game_data)} sample ({sp.full_searches} full / {sp.fast_searches} fast search)"
+                      + (f", xử sớm: {sp.adjudication[1]}" if sp.adjudication is not None else ""))
+            done_queue.put(("done", worker_id, task))
 
-        if game_data:
-            buffer = add_games_to_buffer(buffer, game_data)
-            save_buffer(buffer, buffer_file)
-            print(f"[Worker {worker_id}] Game {i+1} saved. Result: {result}")
-        time.sleep(0.05)
+        if book is not None or tablebase is not None:
+            print(f"[Worker {worker_id}] Bỏ qua {skipped} lần search nhờ sách khai cuộc / tablebase")
+        if adjudicator is not None:
+            print(f"[Worker {worker_id}] Adjudication: {adjudicator.summary()}")
+    finally:
+        profiler.finish()
 
 def main():
-    multiprocessing.set_start_method('spawn', force=True)
+    ctx = worker_context()
 
     model_path = "model.pt"
     model = AlphaZeroNet()
     if os.path.exists(model_path):
-        model.load_state_dict(torch.load(model_path, map_location=device))
+        model.load_state_dict(torch.load(model_path, map_location=get_device()))
 
     trainer = AlphaZeroTrainer(model, epochs=20, batch_size=64)
+    checkpoints = CheckpointManager(keep_last=3)
 
     num_workers = 4
     games_per_worker = 5
     num_iterations = 20
 
-    for iteration in range(num_iterations):
+    # Tạo store trước khi spawn worker; chuyển buffer .pt cũ nếu store còn trống
+    stores = []
+    for i in range(num_workers):
+        store = ReplayStore(replay_store_dir(i))
+        migrated = migrate_buffer(f"replay_buffer_workers_{i}.pt", store)
+        if migrated:
+            print(f"🗂️ Chuyển {migrated} sample từ replay_buffer_workers_{i}.pt sang {store.directory}")
+        stores.append(store)
+    sampler = ReplaySampler(stores, window=REPLAY_WINDOW)
+
+    # Resume: model, optimizer, RNG, con trỏ replay và iteration từ checkpoint mới nhất
+    start_iteration = 0
+    state = checkpoints.load(trainer, sampler)
+    if state is not None:
+        start_iteration = state["iteration"]
+
+    # Worker khởi động một lần, trọng số mới được phát qua shared memory mỗi iteration
+    shared_weights = SharedWeights(trainer.model, ctx=ctx)
+    task_queue = ctx.Queue()
+    done_queue = ctx.Queue()
+    def start_worker(i):
+        p = ctx.Process(
+            target=run_self_play_worker,
+            args=(i, shared_weights, task_queue, done_queue)
+        )
+        p.start()
+        return p
+
+    processes = [start_worker(i) for i in range(num_workers)]
+    restarts = [0] * num_workers
+    in_flight = {}  # worker id -> ván đang chơi
+
+    def wait_games(num_games):
+        # Chờ đủ num_games ván; worker chết giữa chừng được khởi động lại và chỉ ván nó đang chơi được giao lại
+        remaining = num_games
+        while remaining > 0:
+            try:
+                kind, i, task = done_queue.get(timeout=WORKER_POLL)
+                if kind == "started":
+                    in_flight[i] = task
+                else:
+                    in_flight.pop(i, None)
+                    remaining -= 1
+                continue
+            except queue.Empty:
+                pass
+            for i, p in enumerate(processes):
+                if p.is_alive():
+                    continue
+                if restarts[i] >= MAX_WORKER_RESTARTS:
+                    for other in processes:
+                        if other.is_alive():
+                            other.terminate()
+                    raise RuntimeError(f"Worker {i} chết {restarts[i] + 1} lần (exit code {p.exitcode}), dừng training")
+                restarts[i] += 1
+                print(f"[Warning] Worker {i} đã dừng (exit code {p.exitcode}), khởi động lại "
+                      f"({restarts[i]}/{MAX_WORKER_RESTARTS})")
+                processes[i] = start_worker(i)
+                task = in_flight.pop(i, None)
+                if task is not None:
+                    print(f"[Warning] Giao lại game {task} của worker {i}")
+                    task_queue.put(task)
+
+    for iteration in range(start_iteration, num_iterations):
         print(f"\n==============================")
         print(f"🔁 Iteration {iteration+1}/{num_iterations}")
         print(f"==============================")
 
-        # ✅ Backup model trước khi train
-        if os.path.exists(model_path):
-            backup_path = f"model_self_play_backup_iter_{iteration+1}.pt"
-            shutil.copyfile(model_path, backup_path)
-            print(f"🗂️ Backup model to {backup_path}")
-
-        # 🧠 Load mô hình mới nhất cho self-play
-        model.load_state_dict(torch.load(model_path, map_location=device))
+        # 🧠 Phát trọng số mới nhất cho self-play
+        version = shared_weights.publish(trainer.model)
 
         # Self-play phase
-        processes = []
-        for i in range(num_workers):
-            p = multiprocessing.Process(
-                target=run_self_play_worker,
-                args=(i, model_path, games_per_worker)
-            )
-            p.start()
-            processes.append(p)
-
-        for p in processes:
-            p.join()
-
-        # Gom buffer
-        combined_buffer = []
-        for i in range(num_workers):
-            buf = load_buffer(f"replay_buffer_workers_{i}.pt")
-            combined_buffer = add_games_to_buffer(combined_buffer, buf[-5000:]) #Đổi thành -10000 với gpu
-
-        # Train
-        print(f"🧠 Training on {len(combined_buffer)} samples...")
-        trainer.train(combined_buffer)
+        num_games = num_workers * games_per_worker
+        for game in range(num_games):
+            task_queue.put(game + 1)
+        wait_games(num_games)
+
+        # Train: lấy batch trực tiếp từ store của các worker, không gộp buffer
+        print(f"🧠 Training on {len(sampler)} samples (self-play model v{version})...")
+        if TRAIN_RANKS > 1:
+            from data_parallel import train_data_parallel
+            train_data_parallel(trainer, [store.directory for store in stores], TRAIN_RANKS,
+                                window=REPLAY_WINDOW, threads_per_rank=TRAIN_THREADS_PER_RANK, seed=iteration)
+        else:
+            trainer.train_from_sampler(sampler)
 
         # Save model
         trainer.save_model(model_path)
         print(f"✅ Model saved to {model_path}")
+        # Checkpoint ghi ở thread nền trong khi iteration sau chạy self-play
+        checkpoints.save(iteration + 1, trainer, sampler)
+
+    for _ in processes:
+        task_queue.put(None)
+    for p in processes:
+        p.join()
+    checkpoints.close()
 
 if __name__ == "__main__":
     main()
@@ -147,7 +323,7 @@ if __name__ == "__main__":
     # model_path = "model.pt"
     # model = AlphaZeroNet()
     # if os.path.exists(model_path):
-    #     model.load_state_dict(torch.load(model_path, map_location=device))
+    #     model.load_state_dict(torch.load(model_path, map_location=get_device()))
     # trainer = AlphaZeroTrainer(model)
     # trainer.train(total_data)
     # trainer.save_model('model.pt')
@@ -0,0 +1,262 @@
+import sys
+import math
+import os
+import time
+import argparse
+import threading
+import chess
+import torch
+from model import AlphaZeroNet, get_device
+from mcts import MCTS
+from time_manager import MOVE_OVERHEAD, MIN_MOVE_TIME
+from probe import open_book, open_tablebase
+
+ENGINE_NAME = "ChessAI MCTS"
+ENGINE_AUTHOR = "giaprika"
+
+# Ước lượng bộ nhớ cho mỗi node (board copy + dict children), dùng để đổi Hash (MB) ra số node
+NODE_BYTES = 2048
+
+
+def value_to_cp(q):
+    q = max(min(q, 0.999), -0.999)
+    return int(round(400 * math.atanh(q)))
+
+
+class UCIEngine:
+    def __init__(self, model, default_time=2.0):
+        self.model = model
+        self.default_time = default_time
+        self.options = {"Threads": 1, "Hash": 256, "BatchSize": 8}
+        self.board = chess.Board()
+        self.mcts = MCTS(model, time_limit=default_time)
+        self.mcts.info_callback = self.send_info
+        self.search_thread = None
+        self.ponder_limits = None  # giới hạn thời gian áp dụng khi ponderhit; None = không ponder
+        # go infinite / go ponder: search tự dừng (Hash đầy, nodes) vẫn giữ bestmove tới stop / ponderhit
+        self.hold_bestmove = False
+        self.pending_bestmove = None  # (best_move,) đang giữ
+        self.state_lock = threading.Lock()
+        self.output_lock = threading.Lock()
+        self.configure_mcts()
+
+    def send(self, line):
+        with self.output_lock:
+            print(line, flush=True)
+
+    def configure_mcts(self):
+        self.mcts.max_nodes = self.options["Hash"] * 1024 * 1024 // NODE_BYTES
+        self.mcts.num_threads = self.options["Threads"]
+        self.mcts.batch_size = self.options["BatchSize"]
+
+    def send_info(self, mcts):
+        elapsed = max(time.time() - mcts.search_start, 1e-6)
+        depth = mcts.total_depth // max(mcts.simulations, 1)
+        line = (f"info depth {depth} seldepth {mcts.max_depth} nodes {mcts.simulations} "
+                f"nps {int(mcts.simulations / elapsed)} time {int(elapsed * 1000)}")
+        pv = mcts.principal_variation()
+        if pv:
+            best = mcts.root.children[pv[0]]
+            q = best.total_value / best.visit_count
+            line += f" score cp {value_to_cp(q)} pv {' '.join(m.uci() for m in pv)}"
+        self.send(line)
+
+    def handle(self, line):
+        tokens = line.strip().split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send("option name Threads type spin default 1 min 1 max 256")
+            self.send("option name Hash type spin default 256 min 1 max 65536")
+            self.send("option name BatchSize type spin default 8 min 1 max 1024")
+            self.send("option name Ponder type check default false")
+            self.send("option name BookFile type string default <empty>")
+            self.send("option name SyzygyPath type string default <empty>")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.set_option(args)
+        elif command == "ucinewgame":
+            self.stop_search()
+            self.mcts.root = None
+            self.board = chess.Board()
+        elif command == "position":
+            self.stop_search()
+            self.set_position(args)
+        elif command == "go":
+            self.stop_search()
+            self.go(args)
+        elif command == "stop":
+            self.stop_search()
+        elif command == "ponderhit":
+            self.ponderhit()
+        elif command == "quit":
+            self.stop_search()
+            return False
+        return True
+
+    def set_option(self, args):
+        if "name" not in args:
+            return
+        name_end = args.index("value") if "value" in args else len(args)
+        # Tên option trong UCI không phân biệt hoa thường
+        name = " ".join(args[args.index("name") + 1:name_end]).lower()
+        value = " ".join(args[name_end + 1:])
+        options = {option.lower(): option for option in self.options}
+        if name == "bookfile":
+            self.mcts.book = open_book(value)
+        elif name == "syzygypath":
+            self.mcts.tablebase = open_tablebase(value)
+        elif name in options:
+            try:
+                self.options[options[name]] = max(1, int(value))
+            except ValueError:
+                return
+            self.configure_mcts()
+
+    def set_position(self, args):
+        if not args:
+            return
+        if args[0] == "startpos":
+            board = chess.Board()
+            rest = args[1:]
+        elif args[0] == "fen":
+            fen_end = args.index("moves") if "moves" in args else len(args)
+            try:
+                board = chess.Board(" ".join(args[1:fen_end]))
+            except ValueError:
+                self.send(f"info string invalid fen {' '.join(args[1:fen_end])}")
+                return
+            rest = args[fen_end:]
+        else:
+            return
+        if rest and rest[0] == "moves":
+            for uci in rest[1:]:
+                try:
+                    board.push_uci(uci)
+                except ValueError:
+                    # Bỏ qua từ nước không hợp lệ trở đi, giữ engine chạy
+                    self.send(f"info string illegal move {uci}")
+                    break
+        self.board = board
+
+    def parse_go(self, args):
+        params = {}
+        flags = {"infinite", "ponder"}
+        i = 0
+        while i < len(args):
+            if args[i] in flags:
+                params[args[i]] = True
+                i += 1
+            elif i + 1 < len(args):
+                try:
+                    params[args[i]] = int(args[i + 1])
+                except ValueError:
+                    pass
+                i += 2
+            else:
+                i += 1
+        return params
+
+    def time_control(self, params):
+        # Tham số thời gian cho MCTS.search_async, đơn vị giây
+        if "movetime" in params:
+            return {"time_limit": max(params["movetime"] / 1000 - MOVE_OVERHEAD, MIN_MOVE_TIME)}
+        white = self.board.turn == chess.WHITE
+        remaining = params.get("wtime" if white else "btime")
+        if remaining is None:
+            return {} if "nodes" in params else {"time_limit": self.default_time}
+        return {
+            "remaining": remaining / 1000,
+            "increment": params.get("winc" if white else "binc", 0) / 1000,
+            "moves_to_go": params.get("movestogo"),
+        }
+
+    def go(self, args):
+        params = self.parse_go(args)
+        limits = self.time_control(params)
+        if params.get("infinite"):
+            limits = {}
+        self.ponder_limits = None
+        if params.get("ponder"):
+            self.ponder_limits = limits
+            limits = {}
+        with self.state_lock:
+            self.hold_bestmove = bool(params.get("infinite") or params.get("ponder"))
+            self.pending_bestmove = None
+        self.search_thread = self.mcts.search_async(
+            self.board.copy(), max_simulations=params.get("nodes"), on_done=self.search_done, **limits
+        )
+
+    def search_done(self, best_move):
+        with self.state_lock:
+            if self.hold_bestmove:
+                self.pending_bestmove = (best_move,)
+                return
+        self.send_bestmove(best_move)
+
+    def release_bestmove(self):
+        with self.state_lock:
+            self.hold_bestmove = False
+            pending, self.pending_bestmove = self.pending_bestmove, None
+        if pending is not None:
+            self.send_bestmove(pending[0])
+
+    def ponderhit(self):
+        # Đối thủ đi đúng nước đoán trước: chuyển ponder thành search có giới hạn thời gian.
+        # Không có search ponder nào đang chờ thì bỏ qua
+        if self.ponder_limits is None or self.search_thread is None:
+            return
+        limits, self.ponder_limits = self.ponder_limits, None
+        self.mcts.time_manager.start(self.board, **limits)
+        # Ponder đã tự dừng trước đó (Hash đầy, nodes): gửi luôn bestmove đang giữ
+        self.release_bestmove()
+
+    def send_bestmove(self, best_move):
+        if best_move is None:
+            self.send("bestmove 0000")
+            return
+        pv = self.mcts.principal_variation(max_length=2)
+        if len(pv) == 2:
+            self.send(f"bestmove {best_move.uci()} ponder {pv[1].uci()}")
+        else:
+            self.send(f"bestmove {best_move.uci()}")
+
+    def stop_search(self):
+        if self.search_thread is not None:
+            self.mcts.stop()
+            self.search_thread.join()
+            self.search_thread = None
+            self.ponder_limits = None
+            self.release_bestmove()
+
+    def loop(self, stream=sys.stdin):
+        for line in stream:
+            if not self.handle(line):
+                break
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UCI front-end cho MCTS + AlphaZeroNet")
+    parser.add_argument("--model", default="model.pt")
+    parser.add_argument("--blocks", type=int, default=19)
+    parser.add_argument("--time", type=float, default=2.0, help="thời gian mặc định khi go không có giới hạn")
+    args = parser.parse_args()
+
+    model = AlphaZeroNet(n_res_blocks=args.blocks).to(get_device())
+    if os.path.exists(args.model):
+        model.load_state_dict(torch.load(args.model, map_location=get_device()))
+    else:
+        print(f"info string model {args.model} not found, using random weights", flush=True)
+    model.eval()
+
+    UCIEngine(model, default_time=args.time).loop()
+
+
+if __name__ == "__main__":
+    main()
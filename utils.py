@@ -1,7 +1,6 @@
 import os
 import numpy as np
 import chess
-import torch
 
 def get_filename_without_extension(file_path):
     return os.path.splitext(os.path.basename(file_path))[0]
@@ -14,6 +13,11 @@ def get_loss_from_model_name(file_name):
         raise ValueError(f"Filename '{file_name}' does not contain valid loss value.")
 
 def board_to_tensor(board):
+    # torch import khi cần: mcts / features chỉ dùng board_to_planes (numpy), không kéo torch vào lúc import
+    import torch
+    return torch.tensor(board_to_planes(board))
+
+def board_to_planes(board):
     tensor = np.zeros((20, 8, 8), dtype=np.float32)
     
     # Piece channels
@@ -54,7 +58,7 @@ def board_to_tensor(board):
     # Turn
     tensor[19, :, :] = 1 if board.turn == chess.WHITE else 0
     
-    return torch.tensor(tensor)
+    return tensor
 
 def move_to_index(move):
     if not isinstance(move, chess.Move):